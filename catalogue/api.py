@@ -1,16 +1,34 @@
 import base64
+import copy
+import gzip
+import hashlib
 import json
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
+import orjson
 from django.conf import settings
+from django.core.cache import caches
 from django.core.files.base import ContentFile
+from django.db import models, transaction
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from pycsw.core import util
 from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.fields import empty
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 
-from .models import Application, Record, Style
+from . import feeds
+from .bulk import RecordUpsert, upsert_records
+from .cache import get_request_version
+from .models import Record, RecordLink, Style
+from .renderers import ORJSONRenderer
 
 
 # Ows Resource Serializer
@@ -60,12 +78,25 @@ class OwsResourceSerializer(serializers.Serializer):
         return record.format_links(resources)
 
 
+class StyleListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        styles = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if "raw_content" in self.child.fields and len(styles) > 1:
+            # Read the style files from the storage concurrently rather than one after another.
+            with ThreadPoolExecutor(max_workers=min(len(styles), settings.API_STYLE_READ_WORKERS)) as executor:
+                for style, raw_content in zip(styles, executor.map(self.child.get_raw_content, styles)):
+                    style._raw_content = raw_content
+        return super(StyleListSerializer, self).to_representation(styles)
+
+
 # Style Serializer
 class StyleSerializer(serializers.ModelSerializer):
     content = serializers.CharField(write_only=True, allow_null=True)
     name = serializers.CharField(default=Style.BUILTIN)
 
     def get_raw_content(self, obj):
+        if hasattr(obj, "_raw_content"):
+            return obj._raw_content
         if obj.content:
             return base64.b64encode(obj.content.read())
         else:
@@ -92,6 +123,7 @@ class StyleSerializer(serializers.ModelSerializer):
             "default",
             "content",
         )
+        list_serializer_class = StyleListSerializer
 
 
 class LegendSerializer(serializers.Serializer):
@@ -150,24 +182,31 @@ class RecordSerializer(serializers.ModelSerializer):
     def run_validation(self, data=empty):
         return super(RecordSerializer, self).run_validation(data)
 
-    def save(self, **kwargs):
-        self.validated_data["identifier"] = "{}:{}".format(self.validated_data["workspace"], self.validated_data["name"])
+    def get_identifier(self):
+        return "{}:{}".format(self.validated_data["workspace"], self.validated_data["name"])
+
+    def prepare(self, instance):
+        """
+        Prepare the validated data to save the record `instance`, or a new record if it is None:
+        set the identifier, active flag and links and upload the source legend. The instance isn't changed, so
+        the prepared data can be compared with it; the source legend file it had is deleted once the record is
+        saved, see delete_replaced_source_legend.
+        Return the styles data, which are saved after the record.
+        """
+        self.validated_data["identifier"] = self.get_identifier()
+        self.validated_data["active"] = True
         # remove fake fields
         if "workspace" in self.validated_data:
             self.validated_data.pop("workspace")
         if "name" in self.validated_data:
             self.validated_data.pop("name")
 
-        try:
-            self.instance = Record.objects.get(identifier=self.validated_data["identifier"])
-            self.instance.active = True
-
+        if instance:
             for key in ["title", "abstract", "modified", "insert_date"]:
                 if key in self.validated_data:
                     self.validated_data.pop(key)
             self.new_record = False
-
-        except Record.DoesNotExist:
+        else:
             # record does not exist, create it
             self.new_record = True
 
@@ -179,27 +218,50 @@ class RecordSerializer(serializers.ModelSerializer):
                 "upload{}".format(source_legend.get("ext", "")), ContentFile(base64.b64decode(source_legend["content"])), save=False
             )
             self.validated_data["source_legend"] = tmpRecord.source_legend.name
-        elif self.instance and self.instance.source_legend:
-            self.instance.source_legend.delete(save=False)
+        elif instance and instance.source_legend:
             self.validated_data["source_legend"] = None
+        self.replaced_source_legend = None
+        if instance and instance.source_legend and instance.source_legend.name != self.validated_data.get("source_legend"):
+            self.replaced_source_legend = instance.source_legend.name
 
         styles_data = self.validated_data.pop("styles") if "styles" in self.validated_data else None
         ows_resource_validated_data = self.validated_data.pop("ows_resource")
-        if self.instance:
-            tmp_instance = Record.objects.get(identifier=self.validated_data["identifier"])
+        if instance:
+            # Build the links on a copy, the instance is updated when it is saved.
+            tmp_instance = copy.copy(instance)
             for attr, value in self.validated_data.items():
                 setattr(tmp_instance, attr, value)
         else:
             tmp_instance = Record(**self.validated_data)
+        # The links are built from the extent of the new bounding box.
+        tmp_instance.update_extent()
         self.validated_data["links"] = self.fields["ows_resource"].get_links(tmp_instance, ows_resource_validated_data)
+        return styles_data
+
+    def delete_replaced_source_legend(self):
+        """
+        Delete the source legend file replaced by the prepared data, once the saved record is committed.
+        """
+        if self.replaced_source_legend:
+            name, storage = self.replaced_source_legend, Record._meta.get_field("source_legend").storage
+            transaction.on_commit(lambda: storage.delete(name))
+
+    def save(self, **kwargs):
+        try:
+            self.instance = Record.objects.get(identifier=self.get_identifier())
+        except Record.DoesNotExist:
+            self.instance = None
+        styles_data = self.prepare(self.instance)
         result = super(RecordSerializer, self).save(**kwargs)
+        self.delete_replaced_source_legend()
         # save styles
         if styles_data:
             self._update_styles(styles_data)
         return result
 
     def get_tags(self, obj):
-        return obj.tags.values("name", "description")
+        # Read from the prefetched tags.
+        return [{"name": tag.name, "description": tag.description} for tag in obj.tags.all()]
 
     def get_ows_resource(self, obj):
         return obj.ows_resource
@@ -292,24 +354,198 @@ class RecordSerializer(serializers.ModelSerializer):
         )
 
 
+def get_legend_url_period():
+    """
+    Return the number of the current period of the signed legend URLs in the serialized records,
+    which are signed again every half of their lifetime, or None if the media storage is local.
+    """
+    if settings.LOCAL_MEDIA_STORAGE:
+        return None
+    return int(time.time() // (settings.AZURE_URL_EXPIRATION_SECS // 2))
+
+
+def record_etag(request, *args, **kwargs):
+    # The same URL is rendered differently for each accepted media type and legend URL period.
+    etag = get_request_version(request, request.GET.get("application__name"))[0]
+    key = "{}:{}:{}".format(etag, get_legend_url_period(), request.META.get("HTTP_ACCEPT", ""))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def record_last_modified(request, *args, **kwargs):
+    last_modified = get_request_version(request, request.GET.get("application__name"))[1]
+    period = get_legend_url_period()
+    if period is not None:
+        # The legend URLs of a response cached before the current period may have expired.
+        period_start = datetime.fromtimestamp(period * (settings.AZURE_URL_EXPIRATION_SECS // 2), tz=timezone.utc)
+        last_modified = max(filter(None, [last_modified, period_start]))
+    return last_modified
+
+
+class RecordCursorPagination(CursorPagination):
+    """
+    Keyset pagination of records in the Record.Meta.ordering, with (identifier, id) as a
+    unique key so that each page is read from the index without an offset.
+    """
+
+    ordering = ("identifier", "id")
+    page_size = settings.API_RECORDS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_RECORDS_MAX_PAGE_SIZE
+
+
 class RecordViewSet(viewsets.ModelViewSet):
     queryset = Record.objects.all()
     serializer_class = RecordSerializer
     authentication_classes = []
     lookup_field = "identifier"
+    pagination_class = RecordCursorPagination
+    bulk_tags_field = serializers.ListField(child=serializers.SlugField(max_length=255))
+
+    def paginate_queryset(self, queryset):
+        # Consumers which still need the whole list in one response request it with paginate=false.
+        if self.request.query_params.get("paginate", "").lower() in ("false", "0", "no"):
+            return None
+        return super(RecordViewSet, self).paginate_queryset(queryset)
 
     def get_queryset(self):
-        queryset = Record.objects.all()
+        queryset = Record.objects.prefetch_related("tags", "styles")
         application_name = self.request.query_params.get("application__name")
         if application_name is not None:
-            application = Application.objects.get(name=application_name)
-            queryset = queryset.filter(application=application)
+            queryset = queryset.filter(application__name=application_name)
+        # Records with a link of a protocol (e.g. "OGC:WFS" or "application/sld") or of an ows service type (e.g. "WFS").
+        protocol = self.request.query_params.get("protocol")
+        if protocol:
+            queryset = queryset.filter(models.Exists(RecordLink.objects.filter(record=models.OuterRef("pk"), protocol=protocol)))
+        service = self.request.query_params.get("service")
+        if service:
+            queryset = queryset.filter(models.Exists(RecordLink.objects.filter(record=models.OuterRef("pk"), service=service.upper())))
         return queryset
 
     def perform_destroy(self, instance):
         instance.active = False
         instance.save()
 
+    @method_decorator(condition(etag_func=record_etag, last_modified_func=record_last_modified))
+    def list(self, request, *args, **kwargs):
+        if not self.use_record_cache():
+            return super(RecordViewSet, self).list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = self.get_serialized_records(list(page if page is not None else queryset))
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def use_record_cache(self):
+        return bool(settings.API_RECORD_CACHE) and isinstance(self.request.accepted_renderer, ORJSONRenderer)
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Return the records created, updated or deactivated since the `since` token of a previous response, in the
+        order of their changes. Without a token, every record is returned. The records are returned in pages of
+        at most `page_size` records; `more` is true while the token in `next` has more changes to read.
+        The active records are serialized as in the records list, and the deactivated records are listed by identifier.
+        A record changed several times since the token is returned once, in the order of its last change.
+        """
+        since = request.query_params.get("since") or "0.0"
+        try:
+            since_xid, since_id = [int(value) for value in since.split(".")]
+            page_size = min(int(request.query_params.get("page_size", settings.API_RECORDS_PAGE_SIZE)), settings.API_RECORDS_MAX_PAGE_SIZE)
+            if page_size < 1:
+                raise ValueError(page_size)
+        except ValueError:
+            return Response({"detail": "Invalid since token or page size."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only the changes of the ended transactions are returned: a transaction in progress may still commit
+        # changes before the changes of the later transactions already committed.
+        committed_xid = Record.get_committed_xid()
+        records = list(
+            Record.objects.prefetch_related("tags", "styles")
+            .filter(change_xid__gte=since_xid, change_xid__lt=committed_xid)
+            .exclude(change_xid=since_xid, id__lte=since_id)
+            .order_by("change_xid", "id")[: page_size + 1]
+        )
+        more = len(records) > page_size
+        if more:
+            records = records[:page_size]
+            next_token = "{}.{}".format(records[-1].change_xid, records[-1].id)
+        elif since_xid < committed_xid:
+            # Every change before the committed transaction id has been read.
+            next_token = "{}.0".format(committed_xid)
+        else:
+            next_token = since
+
+        active = [record for record in records if record.active]
+        if self.use_record_cache():
+            results = self.get_serialized_records(active)
+        else:
+            results = self.get_serializer(active, many=True).data
+        return Response(
+            {
+                "since": since,
+                "next": next_token,
+                "more": more,
+                "results": results,
+                "deactivated": [record.identifier for record in records if not record.active],
+            }
+        )
+
+    @staticmethod
+    def get_record_cache_key(record):
+        # The tags of a record change without changing its modified date.
+        tags = hashlib.sha1(repr([(tag.name, tag.description) for tag in record.tags.all()]).encode()).hexdigest()
+        return "catalogue:api:record:{}:{}:{}".format(record.pk, record.modified.isoformat(), tags)
+
+    def get_serialized_records(self, records):
+        """
+        Return the records serialized by orjson, as orjson fragments. The serialized records are cached, so that
+        only the records which changed since they were last listed are serialized again.
+        """
+        cache = caches[settings.API_RECORD_CACHE]
+        keys = [self.get_record_cache_key(record) for record in records]
+        serialized = cache.get_many(keys)
+        missing = [(key, record) for key, record in zip(keys, records) if key not in serialized]
+        if missing:
+            data = self.get_serializer([record for key, record in missing], many=True).data
+            serialized_missing = {key: orjson.dumps(item) for (key, record), item in zip(missing, data)}
+            cache.set_many(serialized_missing)
+            serialized.update(serialized_missing)
+        return [orjson.Fragment(serialized[key]) for key in keys]
+
+    @action(detail=False, methods=["get", "post"])
+    def lookup(self, request):
+        """
+        Return the records of a list of identifiers in one request, in the order of the identifiers. The identifiers
+        are the comma separated identifier__in parameter, or the posted list of identifiers. The identifiers without
+        a record are listed in `missing`. The style contents are included as in retrieve with style_content.
+        """
+        if request.method == "POST":
+            identifiers = request.data
+            if not isinstance(identifiers, list) or not all(isinstance(identifier, str) for identifier in identifiers):
+                return Response({"detail": "Expected a list of identifiers."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            identifiers = [identifier for identifier in request.query_params.get("identifier__in", "").split(",") if identifier]
+        # The first occurrence of a repeated identifier gives its position.
+        identifiers = list(dict.fromkeys(identifiers))
+        if len(identifiers) > settings.API_LOOKUP_MAX_IDENTIFIERS:
+            return Response(
+                {"detail": "A lookup request can't have more than {} identifiers.".format(settings.API_LOOKUP_MAX_IDENTIFIERS)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        records = {
+            record.identifier: record for record in Record.objects.prefetch_related("tags", "styles").filter(identifier__in=identifiers)
+        }
+        found = [records[identifier] for identifier in identifiers if identifier in records]
+        style_content = bool(request.GET.get("style_content", False))
+        if not style_content and self.use_record_cache():
+            results = self.get_serialized_records(found)
+        else:
+            results = self.get_serializer(found, many=True, style_content=style_content, serialize_direction="read").data
+        return Response({"results": results, "missing": [identifier for identifier in identifiers if identifier not in records]})
+
+    @method_decorator(condition(etag_func=record_etag, last_modified_func=record_last_modified))
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         style_content = bool(request.GET.get("style_content", False))
@@ -337,47 +573,89 @@ class RecordViewSet(viewsets.ModelViewSet):
         except Exception:
             traceback.print_exc()
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Create or update a list of records in one transaction. Each item has the same data as
+        a record posted to create, plus an optional list of tag names. If any item is invalid,
+        no record is saved. The response has the status of each item, in the request order.
+        """
+        if not isinstance(request.data, list):
+            return Response({"detail": "Expected a list of records."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > settings.API_BULK_MAX_RECORDS:
+            return Response(
+                {"detail": "A bulk request can't have more than {} records.".format(settings.API_BULK_MAX_RECORDS)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = []
+        items = []
+        identifiers = set()
+        for index, data in enumerate(request.data):
+            serializer = self.get_serializer(data=data, serialize_direction="write")
+            tags = None
+            try:
+                serializer.is_valid()
+                errors = serializer.errors
+            except serializers.ValidationError as e:
+                errors = {"bounding_box": e.detail}
+            except ValueError:
+                errors = {"bounding_box": ["Incorrect bounding box dataformat."]}
+            if not errors and data.get("tags") is not None:
+                try:
+                    tags = self.bulk_tags_field.run_validation(data["tags"])
+                except serializers.ValidationError as e:
+                    errors = {"tags": e.detail}
+            if not errors:
+                identifier = serializer.get_identifier()
+                if identifier in identifiers:
+                    errors = {"identifier": ["Duplicate record {} in the request.".format(identifier)]}
+                identifiers.add(identifier)
+            if errors:
+                results.append({"index": index, "status": "invalid", "errors": errors})
+            else:
+                results.append({"index": index, "identifier": identifier, "status": "valid"})
+                items.append((serializer, tags))
+        if len(items) < len(results):
+            return Response({"results": results}, status=status.HTTP_400_BAD_REQUEST)
+
+        existing = {record.identifier: record for record in Record.objects.filter(identifier__in=identifiers).prefetch_related("styles")}
+        upserts = []
+        for serializer, tags in items:
+            record = existing.get(serializer.get_identifier())
+            styles_data = serializer.prepare(record)
+            upserts.append(RecordUpsert(record or Record(), dict(serializer.validated_data), styles_data, tags))
+        with transaction.atomic():
+            upsert_records(upserts)
+            for serializer, tags in items:
+                serializer.delete_replaced_source_legend()
+
+        for result, upsert in zip(results, upserts):
+            result["status"] = upsert.status
+            result["url"] = self.get_serializer().get_url(upsert.record)
+        return Response({"results": results})
+
 
 def application_record(request):
-    rows = []
-    application_name = request.GET.get("application__name", None)
-    if application_name:
-        application = Application.objects.filter(name=application_name)
-        if application.count() > 0:
-            first_record = application[0]
-            for ar in first_record.records.all():
-                row = {}
-                row["abstract"] = ar.abstract
-                row["any_text"] = ar.any_text
-                row["bounding_box"] = ar.bounding_box
-                row["crs"] = ar.crs
-                row["id"] = ar.id
-                row["identifier"] = ar.identifier
-                row["insert_date"] = str(ar.insert_date)
-                row["keywords"] = ar.keywords
-                row["legend"] = ""
-
-                if ar.legend:
-                    row["legend"] = request.build_absolute_uri(ar.legend.url)
-                row["metadata_link"] = {"endpoint": "", "link": "", "type": "", "version": ""}
-                if ar.metadata_link:
-                    row["metadata_link"] = ar.metadata_link(request)
-                row["modified"] = str(ar.modified)
-                row["ows_resource"] = ar.ows_resource
-                row["publication_date"] = str(ar.publication_date)
-                row["service_type"] = ar.service_type
-                row["service_type_version"] = ar.service_type_version
-                row["styles"] = []
-                row["tags"] = []
-                for t in ar.tags.all():
-                    tag_row = {"description": t.description, "name": t.name}
-                    row["tags"].append(tag_row)
-
-                row["title"] = ar.title
-                row["url"] = "{}{}".format(settings.BASE_URL, "/catalogue/api/records/{0}.json".format(ar.identifier))
-                rows.append(row)
-
-    response = HttpResponse(json.dumps(rows), content_type="application/json")
+    """
+    Return the precomputed JSON list of the records of an application, see catalogue.feeds.
+    """
+    feed = feeds.get_feed(request.GET.get("application__name", None) or "")
+    if feed:
+        content, etag = bytes(feed.content), '"{}"'.format(feed.etag)
+    else:
+        content, etag = gzip.compress(b"[]", mtime=0), None
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(content, content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(gzip.decompress(content), content_type="application/json")
+    if etag:
+        response["ETag"] = etag
+    patch_vary_headers(response, ["Accept-Encoding"])
     response["Access-Control-Allow-Origin"] = settings.CORS_URL
     response["Access-Control-Allow-Credentials"] = "true"
     response["Access-Control-Allow-Headers"] = "*"
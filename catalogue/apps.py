@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class CatalogueConfig(AppConfig):
     name = "catalogue"
+
+    def ready(self):
+        # Connect the cache invalidation and application view refresh signal receivers.
+        from catalogue import cache, matviews  # noqa: F401
+        from catalogue.projections import transformers
+
+        transformers.warm()
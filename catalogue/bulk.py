@@ -0,0 +1,165 @@
+import base64
+from itertools import chain
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from catalogue import fragments, matviews
+from catalogue.cache import bump_watermark_counter, capabilities_cache
+from catalogue.models import Record, RecordLink, Style, Tag
+
+
+class RecordUpsert(object):
+    """
+    A record to create or update in a bulk upsert: the record instance (unsaved if it is
+    new), its attribute values, and the uploaded styles and tag names, if any.
+    """
+
+    def __init__(self, record, values, styles_data=None, tags=None):
+        self.record = record
+        self.values = values
+        self.styles_data = styles_data
+        self.tags = tags
+        self.created = record.pk is None
+        # Whether the record fields changed, and whether its styles or tags changed.
+        self.changed = self.created
+        self.related_changed = False
+        self.styles = []
+
+    @property
+    def status(self):
+        if self.created:
+            return "created"
+        return "updated" if self.changed or self.related_changed else "unchanged"
+
+
+def _apply_values(upsert):
+    """
+    Set the attribute values on the record, recording whether any of them changed.
+    """
+    record = upsert.record
+    for attr, value in upsert.values.items():
+        if upsert.created or getattr(record, attr) != value:
+            setattr(record, attr, value)
+            upsert.changed = True
+
+
+def _prepare_styles(upsert):
+    """
+    Upload the styles of the record and prepare the builtin style of each format,
+    choosing the default styles as RecordSerializer._update_styles does.
+    Return the existing styles whose default flag is cleared.
+    """
+    record = upsert.record
+    existing = list(record.styles.all()) if not upsert.created else []
+    origin_default_style = {style.format: style.name for style in existing if style.default}
+    builtin_styles = {style.format: style for style in existing if style.name == Style.BUILTIN}
+    cleared = []
+    # The last uploaded style of a format replaces the builtin style of the format.
+    uploaded_styles = {}
+    for uploaded_style in upsert.styles_data:
+        uploaded_styles[uploaded_style["format"].upper()] = uploaded_style
+    for format, uploaded_style in uploaded_styles.items():
+        default = bool(
+            uploaded_style.get("default", False)
+            or origin_default_style.get(format) == Style.BUILTIN
+            or not origin_default_style.get(format)
+        )
+        style = builtin_styles.get(format) or Style(name=Style.BUILTIN, format=format)
+        style.record = record
+        style.default = default
+        style.content.save("", ContentFile(base64.b64decode(uploaded_style["content"])), save=False)
+        upsert.styles.append(style)
+        upsert.related_changed = True
+        if default:
+            for other in existing:
+                if other.format == format and other.default and other.name != Style.BUILTIN:
+                    other.default = False
+                    cleared.append(other)
+    # Rebuild the style links of the record, keeping the order of the existing links.
+    styles = {(style.name, style.format.lower()): style for style in existing + upsert.styles}
+    style_links = []
+    for link in record.parsed_links:
+        if link.is_style:
+            style = styles.pop((link.schema["name"], link.schema["protocol"].split("/")[-1]), None)
+            style_links.append(Record.generate_style_link(style) if style else link.text)
+    style_links.extend(Record.generate_style_link(style) for style in styles.values())
+    links = Record.format_links(record.ows_links + style_links)
+    if links != record.links:
+        record.links = links
+        upsert.changed = True
+    return cleared
+
+
+def _set_tags(upserts):
+    """
+    Set the tags of the records with tag names, creating the missing tags.
+    """
+    upserts = [upsert for upsert in upserts if upsert.tags is not None]
+    if not upserts:
+        return
+    names = set(name for upsert in upserts for name in upsert.tags)
+    Tag.objects.bulk_create([Tag(name=name, description="") for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list("name", "id"))
+    through = Record.tags.through
+    wanted = set((upsert.record.pk, tag_ids[name]) for upsert in upserts for name in upsert.tags)
+    current = set(through.objects.filter(record_id__in=[upsert.record.pk for upsert in upserts]).values_list("record_id", "tag_id"))
+    removed = current - wanted
+    if removed:
+        for record_id in set(record_id for record_id, tag_id in removed):
+            through.objects.filter(record_id=record_id, tag_id__in=[tag_id for r, tag_id in removed if r == record_id]).delete()
+    through.objects.bulk_create([through(record_id=record_id, tag_id=tag_id) for record_id, tag_id in wanted - current])
+    changed_ids = set(record_id for record_id, tag_id in removed | (wanted - current))
+    for upsert in upserts:
+        if upsert.record.pk in changed_ids:
+            # The full-text vector of the records is updated by the database triggers.
+            upsert.related_changed = True
+
+
+def upsert_records(upserts):
+    """
+    Create and update records, their styles and tags in one transaction, with bulk queries.
+    Only the records which changed are written, and their derived fields (fragments,
+    extent and link rows) are regenerated. The side effects of the Record and Style signal receivers,
+    which bulk queries don't send, are applied once for the whole batch.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        cleared_styles = []
+        for upsert in upserts:
+            _apply_values(upsert)
+            if upsert.styles_data:
+                cleared_styles.extend(_prepare_styles(upsert))
+            if upsert.changed:
+                record = upsert.record
+                if not upsert.created:
+                    record.modified = now
+                fragments.update_fragments(record)
+                record.update_extent()
+
+        Record.objects.bulk_create([upsert.record for upsert in upserts if upsert.created])
+        updated = [upsert for upsert in upserts if upsert.changed and not upsert.created]
+        if updated:
+            fields = set(chain(*[upsert.values.keys() for upsert in updated]))
+            fields |= {"modified"} | set(fragments.ELEMENT_SETS.values()) | set(Record.extent_fields)
+            Record.objects.bulk_update([upsert.record for upsert in updated], fields)
+        RecordLink.sync(
+            [upsert.record for upsert in upserts if upsert.created or upsert.record.links != getattr(upsert.record, "_synced_links", None)]
+        )
+
+        _set_tags(upserts)
+
+        styles = [style for upsert in upserts for style in upsert.styles]
+        new_styles = [style for style in styles if style.pk is None]
+        Style.objects.bulk_update([style for style in styles if style.pk is not None] + cleared_styles, ["content", "default"])
+        Style.objects.bulk_create(new_styles)
+
+        if any(upsert.created for upsert in upserts):
+            # The updateSequence of the capabilities document is the latest record insert date.
+            transaction.on_commit(capabilities_cache.invalidate)
+        changed = [upsert.record for upsert in upserts if upsert.status != "unchanged"]
+        if changed:
+            transaction.on_commit(bump_watermark_counter)
+            matviews.schedule_refresh(matviews.get_record_applications(*changed))
+    return upserts
@@ -0,0 +1,293 @@
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from catalogue.models import Application, CacheGeneration, Collaborator, Organization, PycswConfig, Record, Style, Tag
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ProcessCache(object):
+    """
+    A thread-safe, process-local cache for values which are expensive to build
+    and rarely change. The cache is invalidated as a whole (normally from model
+    signals) and keeps hit/miss counters.
+
+    A generation number is kept in the database for the cache, so that an
+    invalidation in one worker process is seen by every other worker on its
+    next request, see get_generations.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._values = {}
+        # Bumped on every local invalidation, so that a value built while an
+        # invalidation happened is not stored.
+        self._version = 0
+        self._generation = None
+
+    def get(self, key, build):
+        """
+        Return the cached value for `key`, calling `build()` to create it on a miss.
+        A value of None returned by `build()` is not cached.
+        """
+        generation = get_generations().get(self.name, (0, None))[0]
+        with self._lock:
+            if generation != self._generation:
+                self._values.clear()
+                self._generation = generation
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            self.misses += 1
+            version = self._version
+
+        value = build()
+        if value is None:
+            # Nothing to cache, e.g. the value could not be built.
+            return value
+        with self._lock:
+            if version == self._version and generation == self._generation:
+                self._values[key] = value
+        return value
+
+    def invalidate(self):
+        """
+        Discard every cached value in this process and in every other worker process.
+        """
+        with self._lock:
+            self._values.clear()
+            self._version += 1
+        bump_generation(self.name)
+
+    def stats(self):
+        """
+        Return the hit/miss counters and the number of cached values.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._values)}
+
+
+class ResponseCache(object):
+    """
+    A cache of rendered CSW responses in a Django cache, where each entry is
+    stored with the catalogue watermark it was rendered at. An entry is only
+    served while the watermark is unchanged; eviction is left to the cache
+    backend (LRU culling for the locmem and file backends).
+    """
+
+    def __init__(self, alias, max_size):
+        self.alias = alias
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(self.alias)
+
+    def _cache_key(self, key):
+        return "catalogue:response:{}".format(hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key, watermark):
+        """
+        Return the cached (status, content) for `key` if it was rendered at `watermark`, otherwise None.
+        """
+        entry = caches[self.alias].get(self._cache_key(key))
+        if entry is not None and entry[0] == watermark:
+            self.hits += 1
+            return entry[1:]
+        self.misses += 1
+        return None
+
+    def set(self, key, watermark, status, content):
+        if len(content) > self.max_size:
+            return
+        caches[self.alias].set(self._cache_key(key), (watermark, status, content))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+# The generations read by the current thread, see get_generations.
+_generations = threading.local()
+
+
+def get_generations():
+    """
+    Return the (generation, changed date) of the shared cache generations, by name. Every worker process sees
+    the same generations, as they are stored in the database. They are read once per request, and otherwise
+    again after the current thread bumps one.
+    """
+    generations = getattr(_generations, "values", None)
+    if generations is None:
+        generations = {
+            name: (generation, changed)
+            for name, generation, changed in CacheGeneration.objects.values_list("name", "generation", "changed")
+        }
+        _generations.values = generations
+    return generations
+
+
+def reset_generations():
+    _generations.values = None
+
+
+def bump_generation(name):
+    """
+    Increment the shared cache generation `name`.
+    """
+    now = timezone.now()
+    if not CacheGeneration.objects.filter(name=name).update(generation=F("generation") + 1, changed=now):
+        CacheGeneration.objects.bulk_create([CacheGeneration(name=name)], ignore_conflicts=True)
+        CacheGeneration.objects.filter(name=name).update(generation=F("generation") + 1, changed=now)
+    reset_generations()
+
+
+def get_watermark_counter():
+    return get_generations().get("watermark", (0, None))[0]
+
+
+def bump_watermark_counter():
+    """
+    Increment the catalogue watermark counter, for changes which are not reflected
+    in the latest record modified date (deletions, styles, tags, application membership,
+    configuration).
+    """
+    bump_generation("watermark")
+
+
+def catalogue_watermark():
+    """
+    Return a token which changes whenever the catalogue changes: the latest record
+    modified date plus a counter bumped by Record, Style and Application signals.
+    """
+    modified = Record.objects.aggregate(modified=Max("modified"))["modified"]
+    return "{}:{}".format(modified.isoformat() if modified else "", get_watermark_counter())
+
+
+def catalogue_version(app=None):
+    """
+    Return the (etag, last modified) validators of the records of `app`, or of the
+    whole catalogue. The ETag changes with the latest modified date and number of
+    the records and with the catalogue watermark counter; the last modified date is
+    the later of the latest record modified date and the last counter change.
+    """
+    queryset = Record.objects.all()
+    if app:
+        queryset = queryset.filter(application__name=app)
+    version = queryset.aggregate(modified=Max("modified"), count=Count("id"))
+    counter, changed = get_generations().get("watermark", (0, None))
+    last_modified = max(filter(None, [version["modified"], changed]), default=None)
+    key = "{}:{}:{}:{}".format(app or "", version["modified"].isoformat() if version["modified"] else "", version["count"], counter)
+    return hashlib.sha1(key.encode()).hexdigest(), last_modified
+
+
+def get_request_version(request, app=None):
+    """
+    Return the catalogue_version() of `app` once per request, as the ETag and last
+    modified functions of the condition decorator are called separately.
+    """
+    if not hasattr(request, "_catalogue_version"):
+        request._catalogue_version = catalogue_version(app)
+    return request._catalogue_version
+
+
+# The pycsw runtime settings for each application endpoint.
+pycsw_settings_cache = ProcessCache("pycsw_settings")
+# The rendered GetCapabilities documents for each application, CSW version and sections.
+capabilities_cache = ProcessCache("capabilities")
+# The reflected records view of each application.
+application_datasets_cache = ProcessCache("application_datasets")
+# Rendered GetRecords and GetRecordById responses.
+response_cache = ResponseCache(settings.CSW_RESPONSE_CACHE, settings.CSW_RESPONSE_CACHE_MAX_SIZE)
+
+
+class PycswSettingsEventListener(object):
+    @staticmethod
+    @receiver(post_save, sender=PycswConfig)
+    @receiver(post_delete, sender=PycswConfig)
+    @receiver(post_save, sender=Collaborator)
+    @receiver(post_delete, sender=Collaborator)
+    @receiver(post_save, sender=Organization)
+    @receiver(post_delete, sender=Organization)
+    def invalidate_pycsw_settings(sender, instance, **kwargs):
+        # Wait for the commit, otherwise a concurrent request could cache the old values again.
+        transaction.on_commit(pycsw_settings_cache.invalidate)
+
+
+class CapabilitiesEventListener(object):
+    @staticmethod
+    @receiver(post_save, sender=PycswConfig)
+    @receiver(post_delete, sender=PycswConfig)
+    @receiver(post_save, sender=Collaborator)
+    @receiver(post_delete, sender=Collaborator)
+    @receiver(post_save, sender=Organization)
+    @receiver(post_delete, sender=Organization)
+    @receiver(post_save, sender=Application)
+    @receiver(post_delete, sender=Application)
+    def invalidate_capabilities(sender, instance, **kwargs):
+        transaction.on_commit(capabilities_cache.invalidate)
+        # The ETags of the capabilities documents are derived from the watermark counter.
+        transaction.on_commit(bump_watermark_counter)
+
+    @staticmethod
+    @receiver(post_save, sender=Record)
+    def invalidate_capabilities_on_insert(sender, instance, created, **kwargs):
+        # The updateSequence of the capabilities document is the latest record insert date.
+        if created:
+            transaction.on_commit(capabilities_cache.invalidate)
+
+
+class ApplicationDatasetsEventListener(object):
+    @staticmethod
+    @receiver(post_save, sender=Application)
+    def invalidate_application_datasets(sender, instance, created, **kwargs):
+        if created:
+            transaction.on_commit(application_datasets_cache.invalidate)
+
+    @staticmethod
+    @receiver(post_delete, sender=Application)
+    def invalidate_application_datasets_on_delete(sender, instance, **kwargs):
+        transaction.on_commit(application_datasets_cache.invalidate)
+
+
+class GenerationEventListener(object):
+    @staticmethod
+    @receiver(request_started)
+    def read_generations_again(sender, **kwargs):
+        # The generations may have been bumped by another worker process since the last request.
+        reset_generations()
+
+
+class WatermarkEventListener(object):
+    @staticmethod
+    @receiver(post_save, sender=Record)
+    @receiver(post_delete, sender=Record)
+    @receiver(post_save, sender=Style)
+    @receiver(post_delete, sender=Style)
+    @receiver(post_save, sender=Tag)
+    @receiver(post_delete, sender=Tag)
+    @receiver(post_save, sender=Application)
+    @receiver(post_delete, sender=Application)
+    def bump_watermark(sender, instance, **kwargs):
+        transaction.on_commit(bump_watermark_counter)
+
+    @staticmethod
+    @receiver(m2m_changed, sender=Application.records.through)
+    @receiver(m2m_changed, sender=Record.tags.through)
+    def bump_watermark_on_m2m_change(sender, instance, action, **kwargs):
+        if action in ("post_add", "post_remove", "post_clear"):
+            transaction.on_commit(bump_watermark_counter)
@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.utils import timezone
+
+from catalogue.models import Application, ApplicationFeed
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_record_row(record):
+    """
+    Return the feed item of a record.
+    """
+    return {
+        "abstract": record.abstract,
+        "any_text": record.any_text,
+        "bounding_box": record.bounding_box,
+        "crs": record.crs,
+        "id": record.id,
+        "identifier": record.identifier,
+        "insert_date": str(record.insert_date),
+        "keywords": record.keywords,
+        # The legend url is signed by the storage, so the feeds are rebuilt before it expires.
+        "legend": urljoin(settings.BASE_URL, record.legend.url) if record.legend else "",
+        "metadata_link": record.metadata_link(None),
+        "modified": str(record.modified),
+        "ows_resource": record.ows_resource,
+        "publication_date": str(record.publication_date),
+        "service_type": record.service_type,
+        "service_type_version": record.service_type_version,
+        "styles": [],
+        "tags": [{"description": tag.description, "name": tag.name} for tag in record.tags.all()],
+        "title": record.title,
+        "url": "{}{}".format(settings.BASE_URL, "/catalogue/api/records/{0}.json".format(record.identifier)),
+    }
+
+
+def build_feed(application):
+    """
+    Build and save the feed of the application records.
+    """
+    records = application.records.prefetch_related("tags")
+    content = json.dumps([get_record_row(record) for record in records]).encode("utf-8")
+    feed, created = ApplicationFeed.objects.update_or_create(
+        application=application,
+        defaults={
+            "content": gzip.compress(content, mtime=0),
+            "etag": hashlib.sha1(content).hexdigest(),
+            "built": timezone.now(),
+        },
+    )
+    return feed
+
+
+def build_feeds(names):
+    """
+    Rebuild the feeds of the applications in `names`.
+    """
+    for application in Application.objects.filter(name__in=names):
+        try:
+            build_feed(application)
+        except Exception:
+            LOGGER.exception("Failed to build the records feed of the application {}".format(application.name))
+
+
+def get_feed(name):
+    """
+    Return the feed of the application, building it if it doesn't exist or is older than
+    APPLICATION_FEED_MAX_AGE seconds. Return None if the application doesn't exist.
+    """
+    feed = ApplicationFeed.objects.filter(application__name=name).first()
+    if feed and (
+        not settings.APPLICATION_FEED_MAX_AGE or feed.built > timezone.now() - timedelta(seconds=settings.APPLICATION_FEED_MAX_AGE)
+    ):
+        return feed
+    application = Application.objects.filter(name=name).first()
+    return build_feed(application) if application else None
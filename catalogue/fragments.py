@@ -0,0 +1,152 @@
+import functools
+import logging
+
+from lxml import etree
+from pycsw.core import util
+from pycsw.core.config import StaticContext
+from pycsw.ogc.csw.csw2 import write_boundingbox
+
+from catalogue import mappings
+
+LOGGER = logging.getLogger(__name__)
+
+# The csw:Record element sets which are precomputed for each record, and the Record field storing each one.
+ELEMENT_SETS = {
+    "brief": "brief_xml",
+    "summary": "summary_xml",
+    "full": "full_xml",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_context():
+    """
+    Return the pycsw CSW 2.0.2 context and flattened queryables for the catalogue mappings,
+    the same as those of a pycsw server and repository.
+    """
+    context = StaticContext()
+    context.set_model("csw")
+    context.md_core_model = mappings.MD_CORE_MODEL
+    context.refresh_dc(mappings.MD_CORE_MODEL)
+    queryables = {}
+    for tname in context.model["typenames"]:
+        for qname in context.model["typenames"][tname]["queryables"]:
+            queryables.update(context.model["typenames"][tname]["queryables"][qname])
+    queryables.update(context.md_core_model["mappings"])
+    return context, queryables
+
+
+def write_record(recobj, kvp, context, queryables):
+    """
+    Generate a CSW 2.0.2 csw:Record element, replicated from the pycsw method.
+    Only changes is the column separator in links is "\t" instead of ","
+    `recobj` is a repository row or a Record instance.
+    """
+    if kvp["elementsetname"] == "brief":
+        elname = "BriefRecord"
+    elif kvp["elementsetname"] == "summary":
+        elname = "SummaryRecord"
+    else:
+        elname = "Record"
+
+    record = etree.Element(util.nspath_eval("csw:%s" % elname, context.namespaces))
+
+    if "elementname" in kvp and len(kvp["elementname"]) > 0:
+        for elemname in kvp["elementname"]:
+            if elemname.find("BoundingBox") != -1 or elemname.find("Envelope") != -1:
+                bboxel = write_boundingbox(
+                    util.getqattr(recobj, context.md_core_model["mappings"]["pycsw:BoundingBox"]), context.namespaces
+                )
+                if bboxel is not None:
+                    record.append(bboxel)
+            else:
+                value = util.getqattr(recobj, queryables[elemname]["dbcol"])
+                if value:
+                    etree.SubElement(record, util.nspath_eval(elemname, context.namespaces)).text = value
+    elif "elementsetname" in kvp:
+        if (
+            kvp["elementsetname"] == "full"
+            and util.getqattr(recobj, context.md_core_model["mappings"]["pycsw:Typename"]) == "csw:Record"
+            and util.getqattr(recobj, context.md_core_model["mappings"]["pycsw:Schema"]) == "http://www.opengis.net/cat/csw/2.0.2"
+            and util.getqattr(recobj, context.md_core_model["mappings"]["pycsw:Type"]) != "service"
+        ):
+            # dump record as is and exit
+            return etree.fromstring(util.getqattr(recobj, context.md_core_model["mappings"]["pycsw:XML"]), context.parser)
+
+        etree.SubElement(record, util.nspath_eval("dc:identifier", context.namespaces)).text = util.getqattr(
+            recobj, context.md_core_model["mappings"]["pycsw:Identifier"]
+        )
+
+        for i in ["dc:title", "dc:type"]:
+            val = util.getqattr(recobj, queryables[i]["dbcol"])
+            if not val:
+                val = ""
+            etree.SubElement(record, util.nspath_eval(i, context.namespaces)).text = val
+
+        if kvp["elementsetname"] in ["summary", "full"]:
+            # add summary elements
+            keywords = util.getqattr(recobj, queryables["dc:subject"]["dbcol"])
+            if keywords is not None:
+                for keyword in keywords.split(","):
+                    etree.SubElement(record, util.nspath_eval("dc:subject", context.namespaces)).text = keyword
+
+            val = util.getqattr(recobj, queryables["dc:format"]["dbcol"])
+            if val:
+                etree.SubElement(record, util.nspath_eval("dc:format", context.namespaces)).text = val
+
+            # links
+            rlinks = util.getqattr(recobj, context.md_core_model["mappings"]["pycsw:Links"])
+
+            if rlinks:
+                links = rlinks.split("^")
+                for link in links:
+                    linkset = link.split("\t")
+                    etree.SubElement(
+                        record, util.nspath_eval("dct:references", context.namespaces), scheme=linkset[2].replace('"', "&quot;")
+                    ).text = linkset[-1]
+
+            for i in ["dc:relation", "dct:modified", "dct:abstract"]:
+                val = util.getqattr(recobj, queryables[i]["dbcol"])
+                if val is not None:
+                    etree.SubElement(record, util.nspath_eval(i, context.namespaces)).text = val
+
+        if kvp["elementsetname"] == "full":  # add full elements
+            for i in ["dc:date", "dc:creator", "dc:publisher", "dc:contributor", "dc:source", "dc:language", "dc:rights"]:
+                val = util.getqattr(recobj, queryables[i]["dbcol"])
+                if val:
+                    etree.SubElement(record, util.nspath_eval(i, context.namespaces)).text = val
+
+        # always write out ows:BoundingBox
+        bboxel = write_boundingbox(getattr(recobj, context.md_core_model["mappings"]["pycsw:BoundingBox"]), context.namespaces)
+
+        if bboxel is not None:
+            record.append(bboxel)
+    return record
+
+
+def serialize(element, namespaces, encoding="unicode"):
+    """
+    Serialize a record element with the namespace prefixes of the CSW response it is written to.
+    """
+    parent = etree.Element(util.nspath_eval("csw:SearchResults", namespaces), nsmap=namespaces)
+    parent.append(element)
+    etree.cleanup_namespaces(parent)
+    try:
+        return etree.tostring(element, encoding=encoding)
+    finally:
+        parent.remove(element)
+
+
+def update_fragments(record):
+    """
+    Serialize the brief, summary and full csw:Record elements of `record` into its fragment fields.
+    A fragment which can't be built is left empty, and the element is written when it is requested.
+    """
+    context, queryables = get_context()
+    for elementsetname, field in ELEMENT_SETS.items():
+        try:
+            element = write_record(record, {"elementsetname": elementsetname}, context, queryables)
+            setattr(record, field, serialize(element, context.namespaces))
+        except Exception:
+            LOGGER.exception("Failed to build the {} record fragment of {}".format(elementsetname, record.identifier))
+            setattr(record, field, "")
@@ -0,0 +1,68 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from catalogue.views import Csw, Repository, build_pycsw_settings, build_server
+
+
+class Command(BaseCommand):
+    help = "Compare the per-request cost of constructing a new pycsw server with the pooled repository path"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Number of requests to time for each path")
+        parser.add_argument("--maxrecords", type=int, default=10, help="GetRecords maxrecords parameter")
+        parser.add_argument("--elementsetname", default="full", choices=("brief", "summary", "full"))
+
+    def handle(self, *args, **options):
+        kvp = {
+            "service": "CSW",
+            "version": "2.0.2",
+            "request": "GetRecords",
+            "typenames": "csw:Record",
+            "resulttype": "results",
+            "elementsetname": options["elementsetname"],
+            "maxrecords": str(options["maxrecords"]),
+        }
+        env = {"QUERY_STRING": "", "REQUEST_METHOD": "GET"}
+
+        # The construction path used before the pooled repository: the mappings file is loaded and
+        # the repository (engine lookup, table reflection, database type detection) built per request.
+        legacy_settings = build_pycsw_settings()
+        legacy_settings["repository"]["mappings"] = os.path.join(apps.get_app_config("catalogue").path, "mappings.py")
+        legacy_settings["repository"].pop("source")
+
+        def legacy():
+            server = Csw(rtconfig=legacy_settings, env=env)
+            server.requesttype = "GET"
+            server.kvp = dict(kvp)
+            server.dispatch()
+            server.repository.session.close()
+
+        def pooled():
+            server = build_server(env=env)
+            server.requesttype = "GET"
+            server.kvp = dict(kvp)
+            try:
+                server.dispatch()
+            finally:
+                if isinstance(getattr(server, "repository", None), Repository):
+                    server.repository.close()
+
+        # Warm up both paths, so the engine and the pooled prototype exist before timing.
+        legacy()
+        pooled()
+        results = {}
+        for name, func in (("legacy", legacy), ("pooled", pooled)):
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            for i in range(options["iterations"]):
+                func()
+            results[name] = (
+                (time.perf_counter() - start) * 1000 / options["iterations"],
+                (time.process_time() - cpu_start) * 1000 / options["iterations"],
+            )
+            self.stdout.write("{}: {:.2f} ms/request wall, {:.2f} ms/request CPU".format(name, *results[name]))
+
+        self.stdout.write("CPU per request reduced by {:.1f}%".format((1 - results["pooled"][1] / results["legacy"][1]) * 100))
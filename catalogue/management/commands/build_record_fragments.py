@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from catalogue import fragments
+from catalogue.models import Record
+
+
+class Command(BaseCommand):
+    help = "Precompute the brief, summary and full csw:Record fragments of every record"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of records updated per query")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        fields = list(fragments.ELEMENT_SETS.values())
+        batch = []
+        count = 0
+        # Update the fragment fields only, so the records' modified dates are unchanged.
+        for record in Record.objects.order_by("pk").iterator(chunk_size=batch_size):
+            fragments.update_fragments(record)
+            batch.append(record)
+            if len(batch) >= batch_size:
+                Record.objects.bulk_update(batch, fields)
+                count += len(batch)
+                batch = []
+        if batch:
+            Record.objects.bulk_update(batch, fields)
+            count += len(batch)
+        self.stdout.write("Built the fragments of {} records".format(count))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from catalogue import feeds, matviews
+from catalogue.cache import application_datasets_cache, bump_watermark_counter
+from catalogue.models import Application
+
+
+class Command(BaseCommand):
+    help = "Create the missing application records views and refresh the existing ones, and rebuild the application records feeds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("applications", nargs="*", help="Application names (default: every application)")
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Drop and recreate the views, e.g. after columns were added to the records table",
+        )
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help="Only refresh the views of the applications whose records changed since their last refresh",
+        )
+
+    def handle(self, *args, **options):
+        if options["pending"]:
+            names = matviews.refresh_pending()
+            self.stdout.write("Refreshed the records views and feeds of {} applications".format(len(names)))
+            return
+        applications = Application.objects.all()
+        if options["applications"]:
+            applications = applications.filter(name__in=options["applications"])
+        names = list(applications.values_list("name", flat=True))
+        if options["rebuild"]:
+            matviews.rebuild_views(applications)
+            application_datasets_cache.invalidate()
+            bump_watermark_counter()
+            feeds.build_feeds(names)
+        else:
+            matviews.refresh_applications(names)
+        self.stdout.write(
+            "{} the records views and feeds of {} applications".format("Rebuilt" if options["rebuild"] else "Refreshed", len(names))
+        )
@@ -0,0 +1,188 @@
+import difflib
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+
+import numpy
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from catalogue import fragments, matviews
+from catalogue.cache import bump_watermark_counter
+from catalogue.models import Record, RecordLink
+from catalogue.projections import get_gridset, transformers
+
+
+def get_ows_endpoint(record, link):
+    """
+    Return the endpoint, service type and version an ows link was generated from.
+    """
+    schema = link.schema
+    service_type = schema["protocol"][4:].upper()
+    # GWC links are WMS links with the tile size parameters.
+    if service_type == "WMS" and "width" in schema:
+        service_type = "GWC"
+    parameters = []
+    crs = schema.get("crs")
+    if crs and crs.upper() != (record.crs or "").upper():
+        parameters.append(("SRSNAME" if service_type == "WFS" else "SRS", crs))
+    if service_type in ("WMS", "GWC") and schema.get("format") not in (None, "image/png"):
+        parameters.append(("FORMAT", schema["format"]))
+    if service_type == "GWC":
+        gridset = get_gridset(crs or record.crs)
+        tile_size = str(gridset.tile_size) if gridset else None
+        parameters.extend((k.upper(), schema[k]) for k in ("width", "height") if str(schema.get(k)) != tile_size)
+    endpoint = schema["linkage"]
+    if parameters:
+        endpoint = "{}{}{}".format(endpoint, "&" if "?" in endpoint else "?", "&".join("{}={}".format(*p) for p in parameters))
+    return [endpoint, service_type, schema.get("version"), None]
+
+
+def build_links(task):
+    """
+    Return the regenerated links of a record and the error, if any. Run in the worker processes.
+    """
+    identifier, crs, bbox, ows_endpoints, style_links = task
+    record = Record(identifier=identifier, crs=crs)
+    record.bbox_minx, record.bbox_miny, record.bbox_maxx, record.bbox_maxy = bbox or [None] * 4
+    try:
+        links = [record.generate_ows_link(*ows_endpoint) for ows_endpoint in ows_endpoints]
+        return Record.format_links(links + style_links), None
+    except Exception as e:
+        return None, str(e)
+
+
+def init_worker():
+    # The PROJ objects inherited from the parent process are not used after the fork.
+    transformers.clear()
+
+
+class Command(BaseCommand):
+    help = "Regenerate the ows and style links of the records from their current bbox, crs and styles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("identifiers", nargs="*", help="Record identifiers (default: every record)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of records read and updated per query")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes building the links")
+        parser.add_argument("--dry-run", action="store_true", help="Print the diff of the changed links without saving them")
+
+    def prepare(self, records):
+        """
+        Return the link generation task of each record. The bboxes of the ows links are transformed to their
+        target crs together, one call per (record crs, target crs) pair, and the GWC preview tiles of each
+        target crs are computed together.
+        """
+        tasks = []
+        groups = defaultdict(list)
+        for record in records:
+            bbox = record.bbox
+            ows_endpoints = [get_ows_endpoint(record, link) for link in record.parsed_links if link.is_ows]
+            if bbox:
+                for ows_endpoint in ows_endpoints:
+                    target_crs = record.get_ows_target_crs(Record.parse_endpoint_parameters(ows_endpoint[0]), ows_endpoint[1])
+                    if target_crs:
+                        groups[(record.crs, target_crs)].append((ows_endpoint, bbox))
+            style_links = [Record.generate_style_link(style) for style in record.styles.all()]
+            tasks.append((record.identifier, record.crs, bbox, ows_endpoints, style_links))
+
+        for (from_crs, to_crs), items in groups.items():
+            try:
+                target_bboxes = transformers.transform_bounds_array(from_crs, to_crs, [bbox for ows_endpoint, bbox in items])
+            except Exception:
+                # The bboxes are transformed one by one by generate_ows_link, which reports the error.
+                continue
+            target_tiles = [None] * len(items)
+            gridset = get_gridset(to_crs)
+            gwc = numpy.array([ows_endpoint[1] == "GWC" for ows_endpoint, bbox in items]) & numpy.isfinite(target_bboxes).all(axis=1)
+            if gridset and gwc.any():
+                for index, tile in zip(numpy.flatnonzero(gwc), gridset.covering_tiles(target_bboxes[gwc])):
+                    target_tiles[index] = tuple(tile.tolist())
+            for (ows_endpoint, bbox), target_bbox, target_tile in zip(items, target_bboxes, target_tiles):
+                if numpy.isfinite(target_bbox).all():
+                    ows_endpoint[3] = (target_bbox.tolist(), target_tile)
+        return tasks
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+        queryset = Record.objects.prefetch_related("styles").order_by("pk")
+        if options["identifiers"]:
+            queryset = queryset.filter(identifier__in=options["identifiers"])
+
+        pool = None
+        if options["workers"] > 1:
+            # The workers don't query the database, so they must not inherit the connections of this process: they are
+            # closed before the pool forks its processes, which it does when it is created rather than on first use.
+            connections.close_all()
+            pool = multiprocessing.get_context("fork").Pool(options["workers"], initializer=init_worker)
+
+        start = time.monotonic()
+        count = changed_count = failed_count = 0
+        applications = set()
+        last_pk = 0
+        try:
+            while True:
+                records = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+                if not records:
+                    break
+                last_pk = records[-1].pk
+                tasks = self.prepare(records)
+                if pool:
+                    results = pool.imap(build_links, tasks, chunksize=max(1, len(tasks) // (options["workers"] * 4)))
+                else:
+                    results = map(build_links, tasks)
+
+                changed = []
+                now = timezone.now()
+                for record, (links, error) in zip(records, results):
+                    if error:
+                        failed_count += 1
+                        self.stderr.write("Failed to regenerate the links of {}: {}".format(record.identifier, error))
+                        continue
+                    if links == (record.links or ""):
+                        continue
+                    if dry_run:
+                        diff = difflib.unified_diff(
+                            (record.links or "").split("^"),
+                            links.split("^"),
+                            fromfile=record.identifier,
+                            tofile=record.identifier,
+                            lineterm="",
+                        )
+                        self.stdout.write("\n".join(diff))
+                    else:
+                        record.links = links
+                        record.modified = now
+                        fragments.update_fragments(record)
+                    changed.append(record)
+
+                if changed and not dry_run:
+                    with transaction.atomic():
+                        Record.objects.bulk_update(changed, ["links", "modified"] + list(fragments.ELEMENT_SETS.values()))
+                        RecordLink.sync(changed)
+                    applications |= matviews.get_record_applications(*changed)
+                count += len(records)
+                changed_count += len(changed)
+                if options["verbosity"] > 1:
+                    self.stdout.write("{} records, {:.1f} records/s".format(count, count / (time.monotonic() - start)))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        if changed_count and not dry_run:
+            bump_watermark_counter()
+            matviews.refresh_applications(applications)
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            "{} the links of {} of {} records ({} failed) in {:.1f}s, {:.1f} records/s".format(
+                "Would regenerate" if dry_run else "Regenerated",
+                changed_count,
+                count,
+                failed_count,
+                elapsed,
+                count / elapsed if elapsed else 0,
+            )
+        )
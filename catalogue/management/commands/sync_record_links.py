@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from catalogue.models import Record, RecordLink
+
+
+class Command(BaseCommand):
+    help = "Rebuild the normalized link rows of every record from its links column"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of records synced per query")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        batch = []
+        count = 0
+        for record in Record.objects.only("pk", "links").order_by("pk").iterator(chunk_size=batch_size):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                RecordLink.sync(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            RecordLink.sync(batch)
+            count += len(batch)
+        self.stdout.write("Synced the links of {} records".format(count))
@@ -0,0 +1,277 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from catalogue import feeds
+from catalogue.cache import application_datasets_cache, bump_watermark_counter
+from catalogue.models import Application, ApplicationLayer, Record, Tag
+
+LOGGER = logging.getLogger(__name__)
+
+# The records of an application: its records and its layers, with the columns of the Record model. Postgres fixes
+# the columns of a view when it is created, so the migrations which add or alter columns of catalogue_record
+# rebuild the views with the columns as of that migration.
+CREATE_VIEW = """
+CREATE MATERIALIZED VIEW {view} AS
+SELECT {columns} FROM catalogue_record r
+WHERE r.id IN (
+    SELECT record_id FROM catalogue_application_records WHERE application_id = {application_id}
+    UNION
+    SELECT layer_id FROM catalogue_applicationlayer WHERE application_id = {application_id}
+)
+"""
+
+# The indexes of an application view. The unique index is required to refresh the view concurrently, the
+# bbox index has the same expression as the CSW spatial query pre-filter, see catalogue.views.Repository, and
+# the full-text index serves the csw:AnyText queries, as the fts_gin_idx index of the records table.
+CREATE_INDEXES = [
+    "CREATE UNIQUE INDEX {index}_id ON {view} (id)",
+    "CREATE INDEX {index}_identifier ON {view} (identifier)",
+    "CREATE INDEX {index}_modified ON {view} (modified)",
+    "CREATE INDEX {index}_bbox ON {view} USING gist (box(point(bbox_minx, bbox_miny), point(bbox_maxx, bbox_maxy)))",
+    "CREATE INDEX {index}_fts ON {view} USING gin (anytext_tsvector)",
+]
+
+
+def _view(name):
+    return connection.ops.quote_name(Application.get_view_name(name))
+
+
+def view_exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_matviews WHERE matviewname = %s", [Application.get_view_name(name)])
+        return cursor.fetchone() is not None
+
+
+def get_view_columns():
+    """
+    Return the select list of the records columns of an application view.
+    """
+    return ", ".join("r.{}".format(connection.ops.quote_name(field.column)) for field in Record._meta.concrete_fields)
+
+
+def create_view(application):
+    """
+    Create the materialized records view of `application`, with its indexes.
+    """
+    view = _view(application.name)
+    # Index names are derived from the application id, as view names may be truncated to 63 characters.
+    index = "catalogue_application_{}".format(application.pk)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_VIEW.format(view=view, columns=get_view_columns(), application_id=int(application.pk)))
+        for sql in CREATE_INDEXES:
+            cursor.execute(sql.format(index=index, view=view))
+
+
+def rebuild_views(applications):
+    """
+    Drop and recreate the records views of `applications`, with the current columns of the records table.
+    """
+    for application in applications:
+        with transaction.atomic():
+            drop_view(application.name)
+            create_view(application)
+
+
+def drop_view(name):
+    """
+    Drop the records view of the application `name`. The views created before the materialized views
+    are plain views, which DROP MATERIALIZED VIEW doesn't drop.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('v', 'm') AND pg_table_is_visible(oid)",
+            [Application.get_view_name(name)],
+        )
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("DROP {} {}".format("MATERIALIZED VIEW" if row[0] == "m" else "VIEW", _view(name)))
+
+
+def rename_view(old_name, new_name):
+    with connection.cursor() as cursor:
+        cursor.execute("ALTER MATERIALIZED VIEW IF EXISTS {} RENAME TO {}".format(_view(old_name), _view(new_name)))
+
+
+def refresh_views(names):
+    """
+    Refresh the records views of the applications in `names`, without blocking the CSW queries
+    reading them. A view which doesn't exist is created.
+    """
+    refreshed = False
+    for application in Application.objects.filter(name__in=names):
+        try:
+            if view_exists(application.name):
+                with connection.cursor() as cursor:
+                    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY {}".format(_view(application.name)))
+            else:
+                create_view(application)
+                application_datasets_cache.invalidate()
+            refreshed = True
+        except Exception:
+            LOGGER.exception("Failed to refresh the records view of the application {}".format(application.name))
+    if refreshed:
+        # Responses rendered from the views before the refresh are stale.
+        bump_watermark_counter()
+
+
+def refresh_applications(names):
+    """
+    Refresh the records views and rebuild the records feeds of the applications in `names`.
+    """
+    refresh_views(names)
+    feeds.build_feeds(names)
+
+
+def refresh_pending():
+    """
+    Refresh the views and feeds of the applications whose records changed since their last refresh.
+    The pending flags are cleared before the refresh, so the changes committed during the refresh are
+    refreshed again. The applications locked by another refresh are left to it.
+    """
+    with transaction.atomic():
+        names = list(
+            Application.objects.select_for_update(skip_locked=True).filter(view_refresh_pending=True).values_list("name", flat=True)
+        )
+        Application.objects.filter(name__in=names).update(view_refresh_pending=False)
+    if not names:
+        return names
+    try:
+        refresh_applications(names)
+    except Exception:
+        Application.objects.filter(name__in=names).update(view_refresh_pending=True)
+        raise
+    return names
+
+
+class ViewRefresher(object):
+    """
+    Refresh the pending application views and feeds at most once per APPLICATION_VIEW_REFRESH_DELAY seconds:
+    the applications changed during the delay are flagged in the database and their views refreshed together
+    in a background thread. With a delay of 0, views are refreshed immediately. The flags outlive the worker
+    process, so the refreshes it didn't run are run when a worker process starts, or by the
+    refresh_application_views --pending command.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self):
+        if not settings.APPLICATION_VIEW_REFRESH_DELAY:
+            refresh_pending()
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(settings.APPLICATION_VIEW_REFRESH_DELAY, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            refresh_pending()
+        except Exception:
+            LOGGER.exception("Failed to refresh the application records views")
+        finally:
+            # Close the database connections of the timer thread.
+            connections.close_all()
+
+
+view_refresher = ViewRefresher()
+
+
+def schedule_refresh(names):
+    """
+    Flag the views of the applications in `names` for a refresh, in the current transaction, and refresh
+    them after it is committed.
+    """
+    names = set(names)
+    if not names:
+        return
+    Application.objects.filter(name__in=names).update(view_refresh_pending=True)
+    transaction.on_commit(view_refresher.schedule)
+
+
+def get_record_applications(*records):
+    """
+    Return the names of the applications whose views include any of `records`.
+    """
+    return set(
+        Application.objects.filter(records__in=records)
+        .values_list("name", flat=True)
+        .union(Application.objects.filter(applicationlayer__layer__in=records).values_list("name", flat=True))
+    )
+
+
+class ApplicationViewEventListener(object):
+    @staticmethod
+    @receiver(pre_save, sender=Application)
+    def get_previous_name(sender, instance, **kwargs):
+        if instance.pk:
+            instance._previous_name = Application.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+
+    @staticmethod
+    @receiver(post_save, sender=Application)
+    def create_or_rename_view(sender, instance, created, **kwargs):
+        previous_name = getattr(instance, "_previous_name", None)
+        if created:
+            create_view(instance)
+        elif previous_name and previous_name != instance.name:
+            rename_view(previous_name, instance.name)
+            transaction.on_commit(application_datasets_cache.invalidate)
+
+    @staticmethod
+    @receiver(post_delete, sender=Application)
+    def drop_application_view(sender, instance, **kwargs):
+        drop_view(instance.name)
+
+    @staticmethod
+    @receiver(m2m_changed, sender=Application.records.through)
+    def refresh_on_records_change(sender, instance, action, reverse, pk_set, **kwargs):
+        if not reverse and action in ("post_add", "post_remove", "post_clear"):
+            schedule_refresh([instance.name])
+        elif reverse and action in ("post_add", "post_remove"):
+            schedule_refresh(Application.objects.filter(pk__in=pk_set).values_list("name", flat=True))
+        elif reverse and action == "pre_clear":
+            schedule_refresh(Application.objects.filter(records=instance).values_list("name", flat=True))
+
+    @staticmethod
+    @receiver(post_save, sender=ApplicationLayer)
+    @receiver(post_delete, sender=ApplicationLayer)
+    def refresh_on_layer_change(sender, instance, **kwargs):
+        schedule_refresh([instance.application.name])
+
+    @staticmethod
+    @receiver(post_save, sender=Record)
+    def refresh_on_record_change(sender, instance, **kwargs):
+        schedule_refresh(get_record_applications(instance))
+
+    @staticmethod
+    @receiver(pre_delete, sender=Record)
+    def refresh_on_record_delete(sender, instance, **kwargs):
+        # The application memberships are deleted with the record.
+        schedule_refresh(get_record_applications(instance))
+
+    @staticmethod
+    @receiver(m2m_changed, sender=Record.tags.through)
+    def refresh_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+        # The application feeds include the record tags.
+        if action not in ("post_add", "post_remove", "pre_clear"):
+            return
+        if not reverse:
+            schedule_refresh(get_record_applications(instance))
+        else:
+            records = Record.objects.filter(tags=instance) if action == "pre_clear" else Record.objects.filter(pk__in=pk_set)
+            schedule_refresh(get_record_applications(*records))
+
+    @staticmethod
+    @receiver(post_save, sender=Tag)
+    def refresh_on_tag_change(sender, instance, created, **kwargs):
+        if not created:
+            schedule_refresh(get_record_applications(*instance.record_set.all()))
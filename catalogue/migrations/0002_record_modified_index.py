@@ -0,0 +1,17 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="record",
+            name="modified",
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text="Maps to pycsw:Modified"),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0002_record_modified_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="brief_xml",
+            field=models.TextField(default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="full_xml",
+            field=models.TextField(default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="summary_xml",
+            field=models.TextField(default="", editable=False),
+        ),
+    ]
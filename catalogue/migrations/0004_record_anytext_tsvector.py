@@ -0,0 +1,97 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:21
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The full-text vector of a record is computed from its own columns and the names and descriptions of its tags.
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION catalogue_record_anytext_tsvector(record_id integer, title text, keywords text, abstract text, any_text text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(keywords, '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name || ' ' || t.description, ' ')
+            FROM catalogue_record_tags rt JOIN catalogue_tag t ON t.id = rt.tag_id
+            WHERE rt.record_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce(abstract, '')), 'C')
+        || setweight(to_tsvector('english', coalesce(any_text, '')), 'D');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION catalogue_record_anytext_tsvector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.anytext_tsvector := catalogue_record_anytext_tsvector(NEW.id, NEW.title, NEW.keywords, NEW.abstract, NEW.any_text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalogue_record_anytext_tsvector_update
+    BEFORE INSERT OR UPDATE OF title, keywords, abstract, any_text ON catalogue_record
+    FOR EACH ROW EXECUTE FUNCTION catalogue_record_anytext_tsvector_trigger();
+
+CREATE OR REPLACE FUNCTION catalogue_record_tags_anytext_tsvector_trigger() RETURNS trigger AS $$
+DECLARE
+    changed_record_id integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed_record_id := OLD.record_id;
+    ELSE
+        changed_record_id := NEW.record_id;
+    END IF;
+    UPDATE catalogue_record r
+    SET anytext_tsvector = catalogue_record_anytext_tsvector(r.id, r.title, r.keywords, r.abstract, r.any_text)
+    WHERE r.id = changed_record_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalogue_record_tags_anytext_tsvector_update
+    AFTER INSERT OR DELETE ON catalogue_record_tags
+    FOR EACH ROW EXECUTE FUNCTION catalogue_record_tags_anytext_tsvector_trigger();
+
+CREATE OR REPLACE FUNCTION catalogue_tag_anytext_tsvector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE catalogue_record r
+    SET anytext_tsvector = catalogue_record_anytext_tsvector(r.id, r.title, r.keywords, r.abstract, r.any_text)
+    WHERE r.id IN (SELECT record_id FROM catalogue_record_tags WHERE tag_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalogue_tag_anytext_tsvector_update
+    AFTER UPDATE OF name, description ON catalogue_tag
+    FOR EACH ROW EXECUTE FUNCTION catalogue_tag_anytext_tsvector_trigger();
+
+UPDATE catalogue_record
+SET anytext_tsvector = catalogue_record_anytext_tsvector(id, title, keywords, abstract, any_text);
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS catalogue_tag_anytext_tsvector_update ON catalogue_tag;
+DROP TRIGGER IF EXISTS catalogue_record_tags_anytext_tsvector_update ON catalogue_record_tags;
+DROP TRIGGER IF EXISTS catalogue_record_anytext_tsvector_update ON catalogue_record;
+DROP FUNCTION IF EXISTS catalogue_tag_anytext_tsvector_trigger();
+DROP FUNCTION IF EXISTS catalogue_record_tags_anytext_tsvector_trigger();
+DROP FUNCTION IF EXISTS catalogue_record_anytext_tsvector_trigger();
+DROP FUNCTION IF EXISTS catalogue_record_anytext_tsvector(integer, text, text, text, text);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0003_record_fragments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="anytext_tsvector",
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["anytext_tsvector"], name="fts_gin_idx"),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
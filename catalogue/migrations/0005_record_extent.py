@@ -0,0 +1,112 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:19
+
+import re
+
+import django.contrib.postgres.indexes
+import pyproj
+from django.db import migrations, models
+
+# The bounding box WKT of the records, as parsed by Record.parse_bounding_box when this migration was written.
+BBOX_RE = re.compile(
+    r"POLYGON\s*\(\(([\+\-0-9\.]+)\s+([\+\-0-9\.]+)\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\, \s*([\+\-0-9\.]+)\s+([\+\-0-9\.]+)\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\)\)"
+)
+
+EXTENT_FIELDS = ["bbox_minx", "bbox_miny", "bbox_maxx", "bbox_maxy", "wgs84_minx", "wgs84_miny", "wgs84_maxx", "wgs84_maxy"]
+
+# Number of records updated at a time.
+CHUNK_SIZE = 500
+
+
+def get_extent(bounding_box, crs, transformers):
+    """
+    Return the extent of the bounding box in its crs and in EPSG:4326. The EPSG:4326 extent is empty
+    if the bounding box can't be transformed. The transformers to EPSG:4326 are cached by crs.
+    """
+    match = BBOX_RE.match(bounding_box or "")
+    if not match:
+        return [None] * 8
+    bbox = [float(v) for v in match.groups()]
+    if not crs or crs.upper() in ("EPSG:4326", "CRS:84"):
+        return bbox + bbox
+    try:
+        if crs not in transformers:
+            transformers[crs] = pyproj.Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+        return bbox + list(transformers[crs].transform_bounds(*bbox))
+    except Exception:
+        return bbox + [None] * 4
+
+
+def update_extents(apps, schema_editor):
+    Record = apps.get_model("catalogue", "Record")
+    transformers = {}
+    last_pk = 0
+    while True:
+        records = list(Record.objects.filter(pk__gt=last_pk).order_by("pk").only("bounding_box", "crs")[:CHUNK_SIZE])
+        if not records:
+            break
+        for record in records:
+            for field, value in zip(EXTENT_FIELDS, get_extent(record.bounding_box, record.crs, transformers)):
+                setattr(record, field, value)
+        Record.objects.bulk_update(records, EXTENT_FIELDS)
+        last_pk = records[-1].pk
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0004_record_anytext_tsvector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="bbox_maxx",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="bbox_maxy",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="bbox_minx",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="bbox_miny",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="wgs84_maxx",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="wgs84_maxy",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="wgs84_minx",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="wgs84_miny",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=django.contrib.postgres.indexes.GistIndex(
+                models.Func(
+                    models.Func(models.F("bbox_minx"), models.F("bbox_miny"), function="point"),
+                    models.Func(models.F("bbox_maxx"), models.F("bbox_maxy"), function="point"),
+                    function="box",
+                ),
+                name="record_bbox_gist_idx",
+            ),
+        ),
+        migrations.RunPython(update_extents, migrations.RunPython.noop),
+    ]
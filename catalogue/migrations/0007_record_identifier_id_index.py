@@ -0,0 +1,16 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0006_application_views"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(fields=["identifier", "id"], name="record_identifier_id_idx"),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0007_record_identifier_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecordLink",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("position", models.PositiveSmallIntegerField()),
+                ("protocol", models.CharField(max_length=64)),
+                ("service", models.CharField(blank=True, max_length=16)),
+                ("linkage", models.TextField(blank=True)),
+                ("version", models.CharField(blank=True, max_length=16)),
+                ("url", models.TextField()),
+                ("style_name", models.CharField(blank=True, max_length=255)),
+                ("default", models.BooleanField(default=False)),
+                (
+                    "record",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="record_links", to="catalogue.record"),
+                ),
+            ],
+            options={
+                "ordering": ["record", "position"],
+                "indexes": [
+                    models.Index(fields=["protocol", "default"], name="recordlink_protocol_idx"),
+                    models.Index(fields=["service"], name="recordlink_service_idx"),
+                ],
+                "constraints": [models.UniqueConstraint(fields=("record", "position"), name="recordlink_record_position_uniq")],
+            },
+        ),
+    ]
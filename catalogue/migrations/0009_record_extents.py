@@ -0,0 +1,105 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:40
+
+import math
+import re
+
+import pyproj
+from django.db import migrations, models
+
+# The bounding box WKT of the records, as parsed by Record.parse_bounding_box when this migration was written.
+BBOX_RE = re.compile(
+    r"POLYGON\s*\(\(([\+\-0-9\.]+)\s+([\+\-0-9\.]+)\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\, \s*([\+\-0-9\.]+)\s+([\+\-0-9\.]+)\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\)\)"
+)
+
+
+# The gridsets of the RECORD_EXTENT_CRS when this migration was written: the bounds and the maximum zoom level.
+# The extents of the records are computed again with the configured gridsets when the records are saved.
+GRIDSETS = {
+    "EPSG:4326": ((0, -90, 180, 90), 14),
+    "EPSG:3857": ((-20037508.34, -20037508.34, 20037508.34, 20037508.34), 14),
+    "EPSG:900913": ((-20037508.34, -20037508.34, 20037508.34, 20037508.34), 14),
+}
+
+# The custom CRS definitions of catalogue/data/epsg when this migration was written.
+CUSTOM_CRS = {
+    "EPSG:900913": "+proj=merc +a=6378137 +b=6378137 +lat_ts=0.0 +lon_0=0.0 +x_0=0.0 +y_0=0 +k=1.0 +units=m +nadgrids=@null +wktext  +no_defs",
+}
+
+# Number of records updated at a time.
+CHUNK_SIZE = 500
+
+
+def get_transformer(from_crs, to_crs, transformers):
+    """
+    Return the transformer from `from_crs` to `to_crs`, cached by crs pair.
+    """
+    key = (from_crs.upper(), to_crs.upper())
+    if key not in transformers:
+        transformers[key] = pyproj.Transformer.from_crs(*(CUSTOM_CRS.get(crs, crs) for crs in key), always_xy=True)
+    return transformers[key]
+
+
+def covering_tile(gridset, bbox):
+    """
+    Return the bbox of the smallest tile of the gridset, up to its maximum zoom level, which covers the bbox.
+    """
+    bounds, max_zoom = gridset
+    n = 1 << max_zoom
+    width, height = bounds[2] - bounds[0], bounds[3] - bounds[1]
+    minx, maxx = (min(max(math.floor((v - bounds[0]) / width * n), 0), n - 1) for v in (bbox[0], bbox[2]))
+    miny, maxy = (min(max(math.floor((v - bounds[1]) / height * n), 0), n - 1) for v in (bbox[1], bbox[3]))
+    shift = ((minx ^ maxx) | (miny ^ maxy)).bit_length()
+    zoom, x, y = max_zoom - shift, minx >> shift, miny >> shift
+    tile_width, tile_height = width / 2**zoom, height / 2**zoom
+    return [bounds[0] + x * tile_width, bounds[1] + y * tile_height, bounds[0] + (x + 1) * tile_width, bounds[1] + (y + 1) * tile_height]
+
+
+def get_extents(bounding_box, record_crs, transformers):
+    """
+    Return the extents and preview tiles of the bounding box in each of the GRIDSETS crs.
+    """
+    match = BBOX_RE.match(bounding_box or "")
+    if not match or not record_crs:
+        return {}
+    bbox = [float(v) for v in match.groups()]
+    extents = {}
+    for crs, gridset in GRIDSETS.items():
+        try:
+            if record_crs.upper() == crs:
+                extent = list(bbox)
+            else:
+                extent = list(get_transformer(record_crs, crs, transformers).transform_bounds(*bbox))
+        except Exception:
+            continue
+        if all(math.isfinite(v) for v in extent):
+            extents[crs] = {"bbox": extent, "tile": covering_tile(gridset, extent)}
+    return extents
+
+
+def update_extents(apps, schema_editor):
+    Record = apps.get_model("catalogue", "Record")
+    transformers = {}
+    last_pk = 0
+    while True:
+        records = list(Record.objects.filter(pk__gt=last_pk).order_by("pk").only("bounding_box", "crs")[:CHUNK_SIZE])
+        if not records:
+            break
+        for record in records:
+            record.extents = get_extents(record.bounding_box, record.crs, transformers)
+        Record.objects.bulk_update(records, ["extents"])
+        last_pk = records[-1].pk
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0008_record_links"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="extents",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(update_extents, migrations.RunPython.noop),
+    ]
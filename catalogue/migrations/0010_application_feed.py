@@ -0,0 +1,26 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0009_record_extents"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ApplicationFeed",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("content", models.BinaryField()),
+                ("etag", models.CharField(max_length=64)),
+                ("built", models.DateTimeField()),
+                (
+                    "application",
+                    models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="feed", to="catalogue.application"),
+                ),
+            ],
+        ),
+    ]
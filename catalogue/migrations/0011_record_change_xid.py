@@ -0,0 +1,42 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+# Every insert and update of a record, including the updates of its full-text vector when its tags change,
+# records the id of the writing transaction. The existing records keep 0, before any change.
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION catalogue_record_change_xid_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalogue_record_change_xid_update
+    BEFORE INSERT OR UPDATE ON catalogue_record
+    FOR EACH ROW EXECUTE FUNCTION catalogue_record_change_xid_trigger();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS catalogue_record_change_xid_update ON catalogue_record;
+DROP FUNCTION IF EXISTS catalogue_record_change_xid_trigger();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0010_application_feed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="change_xid",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(fields=["change_xid", "id"], name="record_change_idx"),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
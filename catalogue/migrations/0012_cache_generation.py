@@ -0,0 +1,20 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0011_record_change_xid"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheGeneration",
+            fields=[
+                ("name", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("generation", models.BigIntegerField(default=0)),
+                ("changed", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
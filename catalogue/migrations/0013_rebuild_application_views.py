@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# The records of an application when this migration was written: its records and its layers, with the
+# columns of catalogue_record at this migration.
+CREATE_VIEW = """
+CREATE MATERIALIZED VIEW {view} AS
+SELECT
+    r.id, r.identifier, r.title, r.typename, r.schema, r.insert_date, r.xml, r.any_text, r.modified,
+    r.bounding_box, r.abstract, r.keywords, r.publication_date, r.service_type,
+    r.service_type_version, r.links, r.crs, r.active, r.legend, r.source_legend, r.brief_xml,
+    r.full_xml, r.summary_xml, r.anytext_tsvector, r.bbox_maxx, r.bbox_maxy, r.bbox_minx,
+    r.bbox_miny, r.wgs84_maxx, r.wgs84_maxy, r.wgs84_minx, r.wgs84_miny, r.extents, r.change_xid
+FROM catalogue_record r
+WHERE r.id IN (
+    SELECT record_id FROM catalogue_application_records WHERE application_id = {application_id}
+    UNION
+    SELECT layer_id FROM catalogue_applicationlayer WHERE application_id = {application_id}
+)
+"""
+
+# The indexes of an application view. The unique index is required to refresh the view concurrently.
+CREATE_INDEXES = [
+    "CREATE UNIQUE INDEX {index}_id ON {view} (id)",
+    "CREATE INDEX {index}_identifier ON {view} (identifier)",
+    "CREATE INDEX {index}_modified ON {view} (modified)",
+    "CREATE INDEX {index}_bbox ON {view} USING gist (box(point(bbox_minx, bbox_miny), point(bbox_maxx, bbox_maxy)))",
+    "CREATE INDEX {index}_fts ON {view} USING gin (anytext_tsvector)",
+]
+
+
+def rebuild_views(apps, schema_editor):
+    # The views created by 0006 don't have the extents and change_xid columns, nor the full-text index.
+    Application = apps.get_model("catalogue", "Application")
+    for application in Application.objects.all():
+        view = schema_editor.quote_name("catalogue_record_{}".format(application.name))
+        index = "catalogue_application_{}".format(application.pk)
+        schema_editor.execute("DROP MATERIALIZED VIEW IF EXISTS {}".format(view))
+        schema_editor.execute(CREATE_VIEW.format(view=view, application_id=int(application.pk)))
+        for sql in CREATE_INDEXES:
+            schema_editor.execute(sql.format(index=index, view=view))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0012_cache_generation"),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_views, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.14 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalogue", "0013_rebuild_application_views"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="application",
+            name="view_refresh_pending",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,16 +1,25 @@
 import json
+import logging
 import math
 import os
 import re
+from collections import namedtuple
 
-import pyproj
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, Func
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from catalogue import fragments
+from catalogue.projections import get_gridset, transformers
+
+LOGGER = logging.getLogger(__name__)
+
 slug_re = re.compile(r"^[a-z0-9_]+$")
 validate_slug = RegexValidator(
     slug_re,
@@ -19,43 +28,33 @@ validate_slug = RegexValidator(
 )
 
 
-class PreviewTile(object):
-    @staticmethod
-    def _preview_tile(max_tile_bbox, max_zoom, bbox):
-        # compute the tile which can cover the whole bbox
-        tile_bbox = list(max_tile_bbox)
-        zoom_level = 1
-        while zoom_level <= max_zoom:
-            if (
-                bbox[0] - tile_bbox[0] < (tile_bbox[2] - tile_bbox[0]) / 2 and bbox[2] - tile_bbox[0] >= (tile_bbox[2] - tile_bbox[0]) / 2
-            ) or (
-                bbox[1] - tile_bbox[1] < (tile_bbox[3] - tile_bbox[1]) / 2 and bbox[3] - tile_bbox[1] >= (tile_bbox[3] - tile_bbox[1]) / 2
-            ):
-                break
-            if bbox[0] - tile_bbox[0] < (tile_bbox[2] - tile_bbox[0]) / 2:
-                tile_bbox[2] = tile_bbox[0] + (tile_bbox[2] - tile_bbox[0]) / 2
-            else:
-                tile_bbox[0] = tile_bbox[0] + (tile_bbox[2] - tile_bbox[0]) / 2
+class Link(namedtuple("Link", ["text", "schema", "url"])):
+    """
+    A link of the Record links column: the link text, its decoded JSON schema and its URL.
+    A link text is "None\tNone\t<schema>\t<url>", and links are separated by "^".
+    """
 
-            if bbox[1] - tile_bbox[1] < (tile_bbox[3] - tile_bbox[1]) / 2:
-                tile_bbox[3] = tile_bbox[1] + (tile_bbox[3] - tile_bbox[1]) / 2
-            else:
-                tile_bbox[1] = tile_bbox[1] + (tile_bbox[3] - tile_bbox[1]) / 2
-            zoom_level += 1
+    __slots__ = ()
 
-        return tile_bbox
+    @classmethod
+    def parse(cls, text):
+        parts = text.split("\t")
+        return cls(text, json.loads(parts[2]), parts[3])
 
-    @staticmethod
-    def EPSG_4326(bbox):
-        # compute the tile which can cover the whole bbox
-        # gridset bound [-180, -90, 180, 90]
-        return PreviewTile._preview_tile([0, -90, 180, 90], 14, bbox)
+    @classmethod
+    def parse_links(cls, links):
+        """
+        Return the tuple of the parsed links of a links column value.
+        """
+        return tuple(cls.parse(text) for text in links.split("^")) if links else ()
 
-    @staticmethod
-    def EPSG_3857(bbox):
-        # compute the tile which can cover the whole bbox
-        # gridset bound [-20, 037, 508.34, -20, 037, 508.34, 20, 037, 508.34, 20, 037, 508.34]
-        return PreviewTile._preview_tile([-20037508.34, -20037508.34, 20037508.34, 20037508.34], 14, bbox)
+    @property
+    def is_style(self):
+        return "application" in self.schema["protocol"]
+
+    @property
+    def is_ows(self):
+        return "OGC" in self.schema["protocol"]
 
 
 class PycswConfig(models.Model):
@@ -174,7 +173,7 @@ class Record(models.Model):
     insert_date = models.DateTimeField(auto_now_add=True, help_text="Maps to pycsw:InsertDate")
     xml = models.TextField(default="", editable=False, help_text="Maps to pycsw:XML")
     any_text = models.TextField(help_text="Maps to pycsw:AnyText", null=True, blank=True)
-    modified = models.DateTimeField(auto_now=True, help_text="Maps to pycsw:Modified")
+    modified = models.DateTimeField(auto_now=True, db_index=True, help_text="Maps to pycsw:Modified")
     bounding_box = models.TextField(
         null=True,
         blank=True,
@@ -211,6 +210,29 @@ class Record(models.Model):
         blank=True,
         editable=False,
     )
+    # The serialized csw:Record elements for each element set, precomputed on save.
+    brief_xml = models.TextField(default="", editable=False)
+    summary_xml = models.TextField(default="", editable=False)
+    full_xml = models.TextField(default="", editable=False)
+    # The weighted full-text vector of the title, keywords, tags, abstract and any_text, maintained by database
+    # triggers. pycsw translates csw:AnyText queries into full-text queries when the fts_gin_idx index exists.
+    anytext_tsvector = SearchVectorField(null=True, blank=True, editable=False)
+    # The extent of the bounding box in the record CRS and in EPSG:4326, updated on save. pycsw compares the
+    # bounding_box WKT as is, so CSW spatial queries are pre-filtered on the indexed extent in the record CRS.
+    bbox_minx = models.FloatField(null=True, blank=True, editable=False)
+    bbox_miny = models.FloatField(null=True, blank=True, editable=False)
+    bbox_maxx = models.FloatField(null=True, blank=True, editable=False)
+    bbox_maxy = models.FloatField(null=True, blank=True, editable=False)
+    wgs84_minx = models.FloatField(null=True, blank=True, editable=False)
+    wgs84_miny = models.FloatField(null=True, blank=True, editable=False)
+    wgs84_maxx = models.FloatField(null=True, blank=True, editable=False)
+    wgs84_maxy = models.FloatField(null=True, blank=True, editable=False)
+    # The extent and the preview tile of the bounding box in each of the RECORD_EXTENT_CRS, updated on save:
+    # {crs: {"bbox": [minx, miny, maxx, maxy], "tile": [minx, miny, maxx, maxy] or null if the crs has no gridset}}.
+    extents = models.JSONField(default=dict, blank=True, editable=False)
+    # The id of the last transaction which inserted or updated the record, including the updates of its tags,
+    # set by a database trigger. It is the position of the record in the change feed of the records API.
+    change_xid = models.BigIntegerField(default=0, editable=False)
 
     bbox_re = re.compile(
         "POLYGON\s*\(\(([\+\-0-9\.]+)\s+([\+\-0-9\.]+)\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\, \s*([\+\-0-9\.]+)\s+([\+\-0-9\.]+)\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\, \s*[\+\-0-9\.]+\s+[\+\-0-9\.]+\s*\)\)"
@@ -219,19 +241,70 @@ class Record(models.Model):
     @property
     def bbox(self):
         """
-        Transform the bounding box string to bbox array
+        Return the bounding box as [minx, miny, maxx, maxy] in the record CRS, or None.
+        A new list is returned on each access.
         """
-        if hasattr(self, "_bbox"):
-            return getattr(self, "_bbox")
-        elif self.bounding_box:
-            try:
-                bbox = [float(v) for v in self.bbox_re.match(self.bounding_box).groups()]
-                setattr(self, "_bbox", bbox)
-                return bbox
-            except BaseException:
-                return None
-        else:
+        if self.bbox_minx is not None:
+            return [self.bbox_minx, self.bbox_miny, self.bbox_maxx, self.bbox_maxy]
+        # The extent columns are only set on save.
+        return self.parse_bounding_box(self.bounding_box)
+
+    @classmethod
+    def parse_bounding_box(cls, bounding_box):
+        """
+        Transform the bounding box string to bbox array, or None if it can't be parsed.
+        """
+        if not bounding_box:
+            return None
+        match = cls.bbox_re.match(bounding_box)
+        if not match:
+            return None
+        return [float(v) for v in match.groups()]
+
+    def update_extent(self):
+        """
+        Set the extent columns from the bounding box, in the record CRS and in EPSG:4326.
+        The EPSG:4326 extent is left empty if the bounding box can't be transformed.
+        """
+        bbox = self.parse_bounding_box(self.bounding_box) or [None] * 4
+        self.bbox_minx, self.bbox_miny, self.bbox_maxx, self.bbox_maxy = bbox
+        wgs84_bbox = [None] * 4
+        if bbox[0] is not None:
+            if not self.crs or self.crs.upper() in ("EPSG:4326", "CRS:84"):
+                wgs84_bbox = bbox
+            else:
+                try:
+                    wgs84_bbox = transformers.transform_bounds(self.crs, "EPSG:4326", bbox)
+                except Exception as e:
+                    LOGGER.warning(
+                        "Failed to transform the bbox of layer({}) from crs({}) to EPSG:4326.{}".format(self.identifier, self.crs, str(e))
+                    )
+        self.wgs84_minx, self.wgs84_miny, self.wgs84_maxx, self.wgs84_maxy = wgs84_bbox
+        extents = {}
+        if bbox[0] is not None and self.crs:
+            for crs in settings.RECORD_EXTENT_CRS:
+                try:
+                    extent = transformers.transform_bounds(self.crs, crs, bbox)
+                except Exception as e:
+                    LOGGER.warning(
+                        "Failed to transform the bbox of layer({}) from crs({}) to crs({}).{}".format(
+                            self.identifier, self.crs, crs, str(e)
+                        )
+                    )
+                    continue
+                if all(math.isfinite(v) for v in extent):
+                    gridset = get_gridset(crs)
+                    extents[crs.upper()] = {"bbox": extent, "tile": list(gridset.covering_tile(extent)) if gridset else None}
+        self.extents = extents
+
+    def get_extent(self, crs):
+        """
+        Return the stored (bbox, tile) tuples of the bounding box in the crs, or None if they aren't stored.
+        """
+        extent = self.extents.get(crs.upper()) if crs and self.extents else None
+        if not extent:
             return None
+        return tuple(extent["bbox"]), (tuple(extent["tile"]) if extent["tile"] else None)
 
     def __str__(self):
         return self.identifier
@@ -256,22 +329,32 @@ class Record(models.Model):
                 ),
             }
 
+    @property
+    def parsed_links(self):
+        """
+        The parsed links of the links column, cached until the links column changes.
+        """
+        cached = getattr(self, "_parsed_links", None)
+        if cached is None or cached[0] != self.links:
+            cached = (self.links, Link.parse_links(self.links))
+            self._parsed_links = cached
+        return cached[1]
+
     @property
     def ows_resource(self):
         """
         Get ows resource array from ows links in links column
         """
-        links = self.ows_links
         resources = []
-        for link in links:
-            r = re.split("\t", link)
-            sample_link = r[3]
-            r = json.loads(r[2])
+        for link in self.parsed_links:
+            if not link.is_ows:
+                continue
+            r = link.schema
             if "WMS" in r["protocol"]:
                 _type = "WMS"
             elif "WFS" in r["protocol"]:
                 _type = "WFS"
-            resource = {"type": _type, "version": r["version"], "endpoint": r["linkage"], "link": sample_link}
+            resource = {"type": _type, "version": r["version"], "endpoint": r["linkage"], "link": link.url}
             resource.update(r)
             resources.append(resource)
         return resources
@@ -280,27 +363,12 @@ class Record(models.Model):
         """
         Get array of links with specific type from links column
         """
-        if self.links:
-            links = self.links.split("^")
-        else:
-            links = []
+        links = self.parsed_links
         if _type == "style":
-            style_links = []
-            for link in links:
-                r = re.split("\t", link)
-                r_json = json.loads(r[2])
-                if "application" in r_json["protocol"]:
-                    style_links.append(link)
-            links = style_links
+            links = [link for link in links if link.is_style]
         elif _type == "ows":
-            ows_links = []
-            for link in links:
-                r = re.split("\t", link)
-                r_json = json.loads(r[2])
-                if "OGC" in r_json["protocol"]:
-                    ows_links.append(link)
-            links = ows_links
-        return links
+            links = [link for link in links if link.is_ows]
+        return [link.text for link in links]
 
     @property
     def style_links(self):
@@ -316,9 +384,34 @@ class Record(models.Model):
         """
         return self.get_resource_links("ows")
 
-    def generate_ows_link(self, endpoint, service_type, service_version):
+    @staticmethod
+    def parse_endpoint_parameters(endpoint):
+        """
+        Return the parameters of the endpoint's query string as {NAME: [name, value]}
+        """
+        endpoint = endpoint.strip().split("?", 1)
+        endpoint_parameters = endpoint[1].split("&") if len(endpoint) == 2 and endpoint[1] else None
+        return dict([(p.split("=", 1)[0].upper(), p.split("=", 1)) for p in endpoint_parameters] if endpoint_parameters else [])
+
+    def get_ows_target_crs(self, endpoint_parameters, service_type):
+        """
+        Return the crs of the ows link: the crs parameter of the endpoint if any, otherwise the record crs
+        """
+        target_crs = None
+        if service_type == "WFS":
+            target_crs = [endpoint_parameters.get(k)[1] for k in ["SRSNAME"] if k in endpoint_parameters]
+        elif service_type in ["WMS", "GWC"]:
+            target_crs = [endpoint_parameters.get(k)[1] for k in ["SRS", "CRS"] if k in endpoint_parameters]
+
+        if target_crs:
+            return target_crs[0].upper()
+        else:
+            return self.crs.upper() if self.crs else None
+
+    def generate_ows_link(self, endpoint, service_type, service_version, extent=None):
         """
         Return a string ows link
+        extent: the (bbox, tile) of the record in the target crs, if computed in advance; otherwise the stored extent is used
         """
         if service_version in ("1.1.0", "1.1"):
             service_version = "1.1.0"
@@ -330,34 +423,21 @@ class Record(models.Model):
         endpoint = endpoint.strip()
         original_endpoint = endpoint
         # parse endpoint's parameters
-        endpoint = endpoint.split("?", 1)
-        endpoint, endpoint_parameters = (endpoint[0], endpoint[1]) if len(endpoint) == 2 else (endpoint[0], None)
-        endpoint_parameters = endpoint_parameters.split("&") if endpoint_parameters else None
-        endpoint_parameters = dict(
-            [(p.split("=", 1)[0].upper(), p.split("=", 1)) for p in endpoint_parameters] if endpoint_parameters else []
-        )
+        endpoint_parameters = self.parse_endpoint_parameters(endpoint)
+        endpoint = endpoint.split("?", 1)[0]
 
         # get target_crs
-        target_crs = None
-        if service_type == "WFS":
-            target_crs = [endpoint_parameters.get(k)[1] for k in ["SRSNAME"] if k in endpoint_parameters]
-        elif service_type in ["WMS", "GWC"]:
-            target_crs = [endpoint_parameters.get(k)[1] for k in ["SRS", "CRS"] if k in endpoint_parameters]
-
-        if target_crs:
-            target_crs = target_crs[0].upper()
-        else:
-            target_crs = self.crs.upper() if self.crs else None
+        target_crs = self.get_ows_target_crs(endpoint_parameters, service_type)
 
         # transform the bbox between coordinate systems, if required
         bbox = self.bbox or []
+        extent = extent or self.get_extent(target_crs)
         if bbox:
-            if target_crs != self.crs:
+            if extent:
+                bbox = list(extent[0])
+            elif target_crs != self.crs:
                 try:
-                    p1 = pyproj.Proj(init=self.crs)
-                    p2 = pyproj.Proj(init=target_crs)
-                    bbox[0], bbox[1] = pyproj.transform(p1, p2, bbox[0], bbox[1])
-                    bbox[2], bbox[3] = pyproj.transform(p1, p2, bbox[2], bbox[3])
+                    bbox = transformers.transform_bounds(self.crs, target_crs, bbox)
                 except Exception as e:
                     raise ValidationError(
                         "Transform the bbox of layer({0}) from crs({1}) to crs({2}) failed.{3}".format(
@@ -441,6 +521,10 @@ class Record(models.Model):
             if bbox:
                 kvp["BBOX"] = bbox2str(bbox, service_type, service_version)
         elif service_type == "GWC":
+            gridset = get_gridset(target_crs)
+            if not gridset:
+                raise Exception("GWC service don't support crs({}) ".format(target_crs))
+
             service_type = "WMS"
             kvp = {
                 "SERVICE": "WMS",
@@ -448,8 +532,8 @@ class Record(models.Model):
                 "VERSION": service_version,
                 "LAYERS": self.identifier,
                 ("SRS", "CRS"): self.crs.upper(),
-                "WIDTH": 1024,
-                "HEIGHT": 1024,
+                "WIDTH": gridset.tile_size,
+                "HEIGHT": gridset.tile_size,
                 "FORMAT": "image/png",
             }
             parameters = {
@@ -460,16 +544,11 @@ class Record(models.Model):
             }
             if not bbox:
                 # bbox is null, use australian bbox
-                bbox = [108.0000, -45.0000, 155.0000, -10.0000]
-                p1 = pyproj.Proj(init="EPSG:4326")
-                p2 = pyproj.Proj(init=target_crs)
-                bbox[0], bbox[1] = pyproj.transform(p1, p2, bbox[0], bbox[1])
-                bbox[2], bbox[3] = pyproj.transform(p1, p2, bbox[2], bbox[3])
-
-            if not hasattr(PreviewTile, target_crs.replace(":", "_")):
-                raise Exception("GWC service don't support crs({}) ".format(target_crs))
-
-            tile_bbox = getattr(PreviewTile, target_crs.replace(":", "_"))(bbox)
+                tile_bbox = gridset.default_tile()
+            elif extent and extent[1]:
+                tile_bbox = extent[1]
+            else:
+                tile_bbox = gridset.covering_tile(bbox)
 
             kvp["BBOX"] = bbox2str(tile_bbox, service_type, service_version)
         else:
@@ -547,21 +626,14 @@ class Record(models.Model):
     def format_links(resources):
         """
         format resources as link string
+        resources: an array of link strings or Link objects
         """
-        pos = 1
-        links = ""
-        for r in resources:
-            if pos == 1:
-                links += r
-            else:
-                links += "^{0}".format(r)
-            pos += 1
-        return links
+        return "^".join(r.text if isinstance(r, Link) else r for r in resources)
 
     def update_links(self, resources):
         """
         update links if changed
-        resources: a array of string links including ows links and style links
+        resources: a array of string links or Link objects including ows links and style links
         return True if changed;otherwise return False
         """
         links = self.format_links(resources)
@@ -569,6 +641,9 @@ class Record(models.Model):
             return False
         else:
             self.links = links
+            if all(isinstance(r, Link) for r in resources):
+                # The links are already parsed.
+                self._parsed_links = (links, tuple(resources))
             self.save()
             return True
 
@@ -644,14 +719,61 @@ class Record(models.Model):
         else:
             return default_size
 
+    # The columns derived from other fields on save.
+    extent_fields = ("bbox_minx", "bbox_miny", "bbox_maxx", "bbox_maxy", "wgs84_minx", "wgs84_miny", "wgs84_maxx", "wgs84_maxy", "extents")
+
+    def save(self, *args, **kwargs):
+        fragments.update_fragments(self)
+        self.update_extent()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | set(fragments.ELEMENT_SETS.values()) | set(self.extent_fields)
+        super(Record, self).save(*args, **kwargs)
+
     def delete(self, using=None):
         if self.active:
             raise ValidationError("Can not delete the active record ({}).".format(self.identifier))
         else:
             super(Record, self).delete(using)
 
+    @staticmethod
+    def get_committed_xid():
+        """
+        Return the transaction id below which every transaction has ended, ignoring the current transaction.
+        The records changed by the transactions below it are final, while a transaction in progress may still
+        commit changes with a lower id than the changes already committed by later transactions.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT coalesce((SELECT min(x) FROM pg_snapshot_xip(s) x), pg_snapshot_xmax(s))::text::bigint FROM pg_current_snapshot() s"
+            )
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Record, cls).from_db(db, field_names, values)
+        # The links column as loaded, to sync the record links only when it changes.
+        instance._synced_links = instance.__dict__.get("links")
+        return instance
+
     class Meta:
         ordering = ["identifier"]
+        indexes = [
+            # The key of the records API pagination.
+            models.Index(fields=["identifier", "id"], name="record_identifier_id_idx"),
+            # The key of the records change feed.
+            models.Index(fields=["change_xid", "id"], name="record_change_idx"),
+            GinIndex(fields=["anytext_tsvector"], name="fts_gin_idx"),
+            # The same expression as the CSW spatial query pre-filter, see catalogue.views.Repository.
+            GistIndex(
+                Func(
+                    Func(F("bbox_minx"), F("bbox_miny"), function="point"),
+                    Func(F("bbox_maxx"), F("bbox_maxy"), function="point"),
+                    function="box",
+                ),
+                name="record_bbox_gist_idx",
+            ),
+        ]
 
 
 class RecordEventListener(object):
@@ -674,6 +796,75 @@ class RecordEventListener(object):
         """
         pass
 
+    @staticmethod
+    @receiver(post_save, sender=Record)
+    def sync_record_links(sender, instance, created, update_fields=None, **kwargs):
+        if update_fields is not None and "links" not in update_fields:
+            return
+        if created or instance.links != getattr(instance, "_synced_links", None):
+            RecordLink.sync([instance])
+
+
+class RecordLink(models.Model):
+    """
+    A link of the Record links column, normalized to query the records by protocol, service or style.
+    The links column is still the one read by pycsw; its links are synced to this table on save.
+    """
+
+    record = models.ForeignKey(Record, on_delete=models.CASCADE, related_name="record_links")
+    position = models.PositiveSmallIntegerField()
+    # "OGC:WMS", "OGC:WFS" and "OGC:GWC" for ows links, "application/sld", "application/qml" and "application/lyr" for style links.
+    protocol = models.CharField(max_length=64)
+    # The service type of an ows link, empty for a style link.
+    service = models.CharField(max_length=16, blank=True)
+    linkage = models.TextField(blank=True)
+    version = models.CharField(max_length=16, blank=True)
+    url = models.TextField()
+    style_name = models.CharField(max_length=255, blank=True)
+    default = models.BooleanField(default=False)
+
+    @classmethod
+    def from_link(cls, record, position, link):
+        schema = link.schema
+        protocol = schema.get("protocol") or ""
+        return cls(
+            record=record,
+            position=position,
+            protocol=protocol,
+            service=protocol[4:].upper() if link.is_ows else "",
+            linkage=schema.get("linkage") or "",
+            version=schema.get("version") or "",
+            url=link.url,
+            style_name=(schema.get("name") or "") if link.is_style else "",
+            default=bool(schema.get("default")) if link.is_style else False,
+        )
+
+    @classmethod
+    def sync(cls, records):
+        """
+        Replace the link rows of the saved `records` with the links parsed from their links column.
+        """
+        records = [record for record in records if record.pk]
+        if not records:
+            return
+        cls.objects.filter(record__in=records).delete()
+        cls.objects.bulk_create(
+            [cls.from_link(record, position, link) for record in records for position, link in enumerate(record.parsed_links)]
+        )
+        for record in records:
+            record._synced_links = record.links
+
+    def __str__(self):
+        return "{}: {}".format(self.record_id, self.protocol)
+
+    class Meta:
+        ordering = ["record", "position"]
+        constraints = [models.UniqueConstraint(fields=["record", "position"], name="recordlink_record_position_uniq")]
+        indexes = [
+            models.Index(fields=["protocol", "default"], name="recordlink_protocol_idx"),
+            models.Index(fields=["service"], name="recordlink_service_idx"),
+        ]
+
 
 def styleFilePath(instance, filename):
     return "catalogue/styles/{}_{}.{}".format(instance.record.identifier.replace(":", "_"), instance.name, instance.format.lower())
@@ -729,20 +920,18 @@ class StyleEventListener(object):
     @staticmethod
     @receiver(post_save, sender=Style)
     def update_style_link(sender, instance, **kwargs):
-        link = Record.generate_style_link(instance)
-        links_parts = re.split("\t", link)
-        json_link = json.loads(links_parts[2])
+        link = Link.parse(Record.generate_style_link(instance))
         style_index = -1
-        style_links = instance.record.style_links
-        ows_links = instance.record.ows_links
-        if not instance.record.links:
-            instance.record.links = ""
+        record = instance.record
+        style_links = [parsed for parsed in record.parsed_links if parsed.is_style]
+        ows_links = [parsed for parsed in record.parsed_links if parsed.is_ows]
+        if not record.links:
+            record.links = ""
         index = 0
         for style_link in style_links:
-            parts = re.split("\t", style_link)
-            r = json.loads(parts[2])
-            if r["name"] == json_link["name"] and r["protocol"] == json_link["protocol"]:
-                if r["default"] != json_link["default"]:
+            r = style_link.schema
+            if r["name"] == link.schema["name"] and r["protocol"] == link.schema["protocol"]:
+                if r["default"] != link.schema["default"]:
                     style_links[index] = link
                     style_index = index
                 else:
@@ -751,26 +940,22 @@ class StyleEventListener(object):
             index += 1
         if style_index == -1:
             style_links.append(link)
-            links = ows_links + style_links
-            instance.record.update_links(links)
+            record.update_links(ows_links + style_links)
         elif style_index >= 0:
-            links = ows_links + style_links
-            instance.record.update_links(links)
+            record.update_links(ows_links + style_links)
 
     @staticmethod
     @receiver(post_delete, sender=Style)
     def remove_style_link(sender, instance, **kwargs):
-        style_links = instance.record.style_links
-        ows_links = instance.record.ows_links
+        record = instance.record
         # remote deleted style's link
-        for link in style_links:
-            parts = re.split("\t", link)
-            r = json.loads(parts[2])
-            if r["name"] == instance.name and instance.format.lower() in r["protocol"]:
-                style_links.remove(link)
-
-        links = ows_links + style_links
-        instance.record.update_links(links)
+        ows_links = [link for link in record.parsed_links if link.is_ows]
+        style_links = [
+            link
+            for link in record.parsed_links
+            if link.is_style and not (link.schema["name"] == instance.name and instance.format.lower() in link.schema["protocol"])
+        ]
+        record.update_links(ows_links + style_links)
 
     @staticmethod
     @receiver(pre_save, sender=Style)
@@ -820,6 +1005,8 @@ class Application(models.Model):
     last_modify_time = models.DateTimeField(auto_now=True, null=False)
     create_time = models.DateTimeField(auto_now_add=True, null=False)
     records = models.ManyToManyField(Record)
+    # Set with the changes of the application records, until its records view is refreshed, see catalogue.matviews.
+    view_refresh_pending = models.BooleanField(default=False, editable=False)
 
     @staticmethod
     def get_view_name(app):
@@ -851,3 +1038,30 @@ class ApplicationLayer(models.Model):
     class Meta:
         unique_together = ("application", "layer")
         ordering = ["application", "order", "layer"]
+
+
+class ApplicationFeed(models.Model):
+    """
+    The precomputed JSON list of the records of an application, gzip compressed, see catalogue.feeds
+    """
+
+    application = models.OneToOneField(Application, on_delete=models.CASCADE, related_name="feed")
+    content = models.BinaryField()
+    etag = models.CharField(max_length=64)
+    built = models.DateTimeField()
+
+    def __str__(self):
+        return self.application.name
+
+
+class CacheGeneration(models.Model):
+    """
+    A counter shared by the worker processes, bumped when the values cached from it are stale, see catalogue.cache
+    """
+
+    name = models.CharField(max_length=64, primary_key=True)
+    generation = models.BigIntegerField(default=0)
+    changed = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{}:{}".format(self.name, self.generation)
@@ -0,0 +1,198 @@
+import functools
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy
+import pyproj
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# The custom CRS definitions, in the PROJ init file format: "<code> +proj=... <>".
+CUSTOM_CRS_FILE = os.path.join(os.path.dirname(__file__), "data", "epsg")
+
+custom_crs_re = re.compile(r"^\s*<(\w+)>\s*(.+?)\s*<>\s*$")
+
+
+def load_custom_crs(path=CUSTOM_CRS_FILE):
+    """
+    Return the PROJ strings of the custom CRS definitions in `path`, keyed by "EPSG:<code>".
+    """
+    definitions = {}
+    if not os.path.exists(path):
+        return definitions
+    with open(path) as f:
+        for line in f:
+            match = custom_crs_re.match(line)
+            if match:
+                definitions["EPSG:{}".format(match.group(1))] = match.group(2)
+    return definitions
+
+
+class TransformerRegistry(object):
+    """
+    A thread-safe LRU cache of the transformers between pairs of CRSs. Creating a transformer
+    looks the CRSs up in the PROJ database, so each pair is only created once per process.
+    The transformers use the longitude, latitude (x, y) axis order for every CRS.
+    """
+
+    def __init__(self, maxsize=None, custom_crs=None):
+        self.maxsize = maxsize
+        self.custom_crs = load_custom_crs() if custom_crs is None else custom_crs
+        self._lock = threading.Lock()
+        self._transformers = OrderedDict()
+
+    def get_crs(self, crs):
+        crs = crs.upper()
+        return pyproj.CRS.from_user_input(self.custom_crs.get(crs, crs))
+
+    def get(self, from_crs, to_crs):
+        """
+        Return the transformer from `from_crs` to `to_crs`.
+        """
+        key = (from_crs.upper(), to_crs.upper())
+        with self._lock:
+            transformer = self._transformers.get(key)
+            if transformer is not None:
+                self._transformers.move_to_end(key)
+                return transformer
+        # The transformer is created outside of the lock; concurrent misses for the same pair create equivalent transformers.
+        transformer = pyproj.Transformer.from_crs(self.get_crs(key[0]), self.get_crs(key[1]), always_xy=True)
+        maxsize = self.maxsize or settings.PROJ_TRANSFORMER_CACHE_SIZE
+        with self._lock:
+            self._transformers[key] = transformer
+            while len(self._transformers) > maxsize:
+                self._transformers.popitem(last=False)
+        return transformer
+
+    def transform_bounds(self, from_crs, to_crs, bbox):
+        """
+        Return the extent [minx, miny, maxx, maxy] in `to_crs` of the bbox in `from_crs`. The edges of the bbox
+        are densified, so the result covers the whole transformed bbox and not only its transformed corners.
+        """
+        if from_crs.upper() == to_crs.upper():
+            return list(bbox)
+        return list(self.get(from_crs, to_crs).transform_bounds(*bbox))
+
+    def transform_bounds_array(self, from_crs, to_crs, bboxes, densify_pts=21):
+        """
+        Return the extents in `to_crs` of an (N, 4) array of bboxes in `from_crs`, as an (N, 4) array.
+        The densified edges of all the bboxes are transformed in one call, as transform_bounds does for one bbox.
+        """
+        bboxes = numpy.asarray(bboxes, dtype=float).reshape(-1, 4)
+        if from_crs.upper() == to_crs.upper() or not len(bboxes):
+            return bboxes.copy()
+        minx, miny, maxx, maxy = (bboxes[:, [i]] for i in range(4))
+        steps = numpy.linspace(0, 1, densify_pts + 2)
+        xs = minx + (maxx - minx) * steps
+        ys = miny + (maxy - miny) * steps
+        # The bottom, top, left and right edges of each bbox.
+        x = numpy.hstack([xs, xs, numpy.broadcast_to(minx, ys.shape), numpy.broadcast_to(maxx, ys.shape)])
+        y = numpy.hstack([numpy.broadcast_to(miny, xs.shape), numpy.broadcast_to(maxy, xs.shape), ys, ys])
+        x, y = self.get(from_crs, to_crs).transform(x, y)
+        # The points outside of the area of use of the target crs are ignored.
+        x[~numpy.isfinite(x)] = numpy.nan
+        y[~numpy.isfinite(y)] = numpy.nan
+        return numpy.column_stack([numpy.nanmin(x, axis=1), numpy.nanmin(y, axis=1), numpy.nanmax(x, axis=1), numpy.nanmax(y, axis=1)])
+
+    def warm(self, crs_list=None):
+        """
+        Create the transformers between every pair of the common CRSs.
+        """
+        crs_list = crs_list if crs_list is not None else settings.PROJ_COMMON_CRS
+        for from_crs in crs_list:
+            for to_crs in crs_list:
+                if from_crs != to_crs:
+                    try:
+                        self.get(from_crs, to_crs)
+                    except Exception as e:
+                        LOGGER.warning("Failed to create the transformer from crs({}) to crs({}).{}".format(from_crs, to_crs, str(e)))
+
+    def clear(self):
+        with self._lock:
+            self._transformers.clear()
+
+    def __len__(self):
+        return len(self._transformers)
+
+
+transformers = TransformerRegistry()
+
+
+class Gridset(namedtuple("Gridset", ["crs", "bounds", "max_zoom", "tile_size"])):
+    """
+    A GeoWebCache gridset: a quadtree of tiles over the bounds, from one tile at zoom level 0 to
+    2 ** max_zoom tiles per axis at max_zoom. The tile size is the width and height of a tile image.
+    """
+
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1]
+
+    def _tile_bbox(self, zoom, x, y):
+        width, height = self.size
+        tile_width, tile_height = width / 2**zoom, height / 2**zoom
+        return (
+            self.bounds[0] + x * tile_width,
+            self.bounds[1] + y * tile_height,
+            self.bounds[0] + (x + 1) * tile_width,
+            self.bounds[1] + (y + 1) * tile_height,
+        )
+
+    def covering_tile(self, bbox):
+        """
+        Return the bbox of the smallest tile, up to max_zoom, which covers the bbox, as if the bbox was
+        clipped to the gridset bounds. The tile containing both bbox corners is found from
+        their tile indexes at max_zoom: the indexes of a tile at zoom z are the leading z bits of the indexes
+        of its tiles at max_zoom, so the covering tile is given by the leading bits they have in common.
+        """
+        n = 1 << self.max_zoom
+        width, height = self.size
+        minx, maxx = (min(max(math.floor((v - self.bounds[0]) / width * n), 0), n - 1) for v in (bbox[0], bbox[2]))
+        miny, maxy = (min(max(math.floor((v - self.bounds[1]) / height * n), 0), n - 1) for v in (bbox[1], bbox[3]))
+        shift = ((minx ^ maxx) | (miny ^ maxy)).bit_length()
+        return self._tile_bbox(self.max_zoom - shift, minx >> shift, miny >> shift)
+
+    def covering_tiles(self, bboxes):
+        """
+        Return the covering tiles of an (N, 4) array of bboxes, as an (N, 4) array.
+        """
+        bboxes = numpy.asarray(bboxes, dtype=float).reshape(-1, 4)
+        n = 1 << self.max_zoom
+        width, height = self.size
+        x = numpy.clip(numpy.floor((bboxes[:, [0, 2]] - self.bounds[0]) / width * n), 0, n - 1).astype(numpy.int64)
+        y = numpy.clip(numpy.floor((bboxes[:, [1, 3]] - self.bounds[1]) / height * n), 0, n - 1).astype(numpy.int64)
+        diff = (x[:, 0] ^ x[:, 1]) | (y[:, 0] ^ y[:, 1])
+        # The bit length of the indexes differences.
+        shift = numpy.where(diff > 0, numpy.floor(numpy.log2(numpy.maximum(diff, 1))).astype(numpy.int64) + 1, 0)
+        return numpy.column_stack(self._tile_bbox(self.max_zoom - shift, x[:, 0] >> shift, y[:, 0] >> shift))
+
+    def default_tile(self, bbox=(108.0, -45.0, 155.0, -10.0)):
+        """
+        Return the covering tile of the australian bbox, used for the layers without bbox.
+        """
+        return get_default_tile(self, tuple(bbox))
+
+
+@functools.lru_cache(maxsize=None)
+def get_default_tile(gridset, bbox):
+    """
+    Return the covering tile in the gridset of the EPSG:4326 bbox, computed once per gridset and bbox.
+    """
+    return gridset.covering_tile(transformers.transform_bounds("EPSG:4326", gridset.crs, bbox))
+
+
+def get_gridset(crs):
+    """
+    Return the gridset of the crs configured in GWC_GRIDSETS, or None.
+    """
+    config = settings.GWC_GRIDSETS.get(crs.upper()) if crs else None
+    if not config:
+        return None
+    return Gridset(crs.upper(), tuple(config["bounds"]), int(config["max_zoom"]), int(config.get("tile_size", 256)))
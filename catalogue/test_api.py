@@ -1,10 +1,20 @@
+import base64
+import gzip
 import json
+import tempfile
+from io import StringIO
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.http import parse_http_date
 from mixer.backend.django import mixer
 
-from catalogue.models import Application, Record
+from catalogue.api import RecordViewSet
+from catalogue.models import Application, Record, Style, Tag
 
 
 class RecordAPITestCase(TestCase):
@@ -22,11 +32,64 @@ class RecordAPITestCase(TestCase):
         resp = self.client.get(url, data=params)
         self.assertEqual(resp.status_code, 200)
 
+    def test_list_num_queries(self):
+        """Test that the number of queries to list records doesn't depend on the number of records"""
+        tags = mixer.cycle(2).blend(Tag)
+        for record in Record.objects.all():
+            record.tags.set(tags)
+            mixer.blend(Style, record=record, name=Style.BUILTIN, format="SLD", content="test.sld")
+        app = mixer.blend(Application, name="test")
+        app.records.set(Record.objects.all())
+        url = "/catalogue/api/records/"
+        # The catalogue version, the cache generations, the page of records, their tags and their styles.
+        with self.assertNumQueries(5):
+            resp = self.client.get(url, data={"format": "json"})
+        self.assertEqual(len(json.loads(resp.content.decode("utf-8"))["results"]), 8)
+        self.assertEqual(len(json.loads(resp.content.decode("utf-8"))["results"][0]["tags"]), 2)
+        with self.assertNumQueries(5):
+            self.client.get(url, data={"format": "json", "application__name": "test"})
+
+    def test_list_cached(self):
+        """Test that the listed records are served from the serialized records cache until they change"""
+        url = "/catalogue/api/records/"
+        record = Record.objects.first()
+        resp = self.client.get(url, data={"format": "json", "paginate": "false"})
+        listed = {r["identifier"]: r for r in json.loads(resp.content.decode("utf-8"))}
+        cache = caches[settings.API_RECORD_CACHE]
+        self.assertIsNotNone(cache.get(RecordViewSet.get_record_cache_key(record)))
+        # The cached records are the serialized records.
+        resp = self.client.get(url, data={"format": "json", "paginate": "false"})
+        self.assertEqual({r["identifier"]: r for r in json.loads(resp.content.decode("utf-8"))}, listed)
+        # A record is serialized again after its tags change.
+        record.tags.add(mixer.blend(Tag, name="cached"))
+        resp = self.client.get(url, data={"format": "json", "paginate": "false"})
+        listed = {r["identifier"]: r for r in json.loads(resp.content.decode("utf-8"))}
+        self.assertEqual([tag["name"] for tag in listed[record.identifier]["tags"]], ["cached"])
+
+    def test_lookup(self):
+        """Test that the records of a list of identifiers are returned in one request, in the requested order"""
+        records = list(Record.objects.order_by("-identifier")[:3])
+        identifiers = [records[0].identifier, "missing", records[2].identifier, records[1].identifier, records[0].identifier]
+        url = "/catalogue/api/records/lookup/"
+        # The records, their tags and their styles.
+        with self.assertNumQueries(3):
+            resp = self.client.get(url, data={"format": "json", "identifier__in": ",".join(identifiers)})
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.content.decode("utf-8"))
+        self.assertEqual([r["identifier"] for r in data["results"]], [records[0].identifier, records[2].identifier, records[1].identifier])
+        self.assertEqual(data["missing"], ["missing"])
+        resp = self.client.get(url, data={"format": "json", "identifier__in": identifiers[0], "style_content": "true"})
+        self.assertEqual(len(json.loads(resp.content.decode("utf-8"))["results"]), 1)
+        resp = self.client.post(url + "?format=json", json.dumps(identifiers), content_type="application/json")
+        self.assertEqual(json.loads(resp.content.decode("utf-8")), data)
+        resp = self.client.post(url, json.dumps({"identifier": "invalid"}), content_type="application/json")
+        self.assertEqual(resp.status_code, 400)
+
     def test_list_filter(self):
         url = "/catalogue/api/records/"
         params = {"format": "json"}
         resp = self.client.get(url, data=params)
-        unfiltered = json.loads(resp.content.decode("utf-8"))
+        unfiltered = json.loads(resp.content.decode("utf-8"))["results"]
         records = Record.objects.all()
         rec1, rec2 = records[0], records[1]
         # Generate an Application
@@ -38,5 +101,241 @@ class RecordAPITestCase(TestCase):
         self.assertContains(resp, rec1.title)
         self.assertNotContains(resp, rec2.title)
         # The filtered response will be shorter than the unfiltered one.
-        filtered = json.loads(resp.content.decode("utf-8"))
+        filtered = json.loads(resp.content.decode("utf-8"))["results"]
         self.assertTrue(len(unfiltered) > len(filtered))
+
+    def test_list_filter_protocol(self):
+        """Test that the records are filtered on the protocols of their links"""
+        wms_link = 'None\tNone\t{"protocol": "OGC:WMS", "linkage": "https://example.com/ows", "version": "1.1.1"}\thttps://example.com/ows?service=WMS'
+        wfs_link = 'None\tNone\t{"protocol": "OGC:WFS", "linkage": "https://example.com/ows", "version": "1.1.0"}\thttps://example.com/ows?service=WFS'
+        rec1, rec2 = Record.objects.all()[:2]
+        rec1.update_links([wms_link, wfs_link])
+        rec2.update_links([wms_link])
+        self.assertEqual(rec1.record_links.count(), 2)
+        url = "/catalogue/api/records/"
+        resp = self.client.get(url, data={"format": "json", "protocol": "OGC:WFS"})
+        self.assertEqual([r["identifier"] for r in json.loads(resp.content.decode("utf-8"))["results"]], [rec1.identifier])
+        resp = self.client.get(url, data={"format": "json", "service": "wms"})
+        self.assertEqual(len(json.loads(resp.content.decode("utf-8"))["results"]), 2)
+        # The link rows follow the links column.
+        rec1.update_links([wms_link])
+        resp = self.client.get(url, data={"format": "json", "service": "WFS"})
+        self.assertEqual(json.loads(resp.content.decode("utf-8"))["results"], [])
+
+    def test_list_paginated(self):
+        url = "/catalogue/api/records/"
+        params = {"format": "json", "page_size": 3}
+        identifiers = []
+        while url:
+            resp = self.client.get(url, data=params)
+            self.assertEqual(resp.status_code, 200)
+            page = json.loads(resp.content.decode("utf-8"))
+            self.assertTrue(len(page["results"]) <= 3)
+            identifiers.extend(r["identifier"] for r in page["results"])
+            url, params = page["next"], None
+        self.assertEqual(identifiers, list(Record.objects.order_by("identifier", "id").values_list("identifier", flat=True)))
+        # The whole list is returned in one response if pagination is disabled.
+        resp = self.client.get("/catalogue/api/records/", data={"format": "json", "paginate": "false"})
+        self.assertEqual(len(json.loads(resp.content.decode("utf-8"))), 8)
+
+    def test_list_not_modified(self):
+        url = "/catalogue/api/records/"
+        params = {"format": "json"}
+        resp = self.client.get(url, data=params)
+        self.assertTrue(resp.has_header("ETag"))
+        self.assertTrue(resp.has_header("Last-Modified"))
+        resp = self.client.get(url, data=params, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+        # The ETag changes after a record is deleted.
+        record = Record.objects.first()
+        record.active = False
+        record.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        resp = self.client.get(url, data=params, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 200)
+
+    @override_settings(LOCAL_MEDIA_STORAGE=False, AZURE_URL_EXPIRATION_SECS=3600)
+    def test_list_legend_urls_expired(self):
+        """Test that the validators change every half of the lifetime of the signed legend URLs"""
+        url = "/catalogue/api/records/"
+        params = {"format": "json"}
+        period_start = 1800 * 1000000
+        with mock.patch("catalogue.api.time.time", return_value=period_start + 1799):
+            resp = self.client.get(url, data=params)
+            self.assertEqual(parse_http_date(resp["Last-Modified"]), period_start)
+            self.assertEqual(self.client.get(url, data=params, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+        with mock.patch("catalogue.api.time.time", return_value=period_start + 1800):
+            self.assertEqual(self.client.get(url, data=params, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 200)
+            self.assertEqual(self.client.get(url, data=params, HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"]).status_code, 200)
+
+
+class RecordChangesAPITestCase(TransactionTestCase):
+    """The change feed only returns the changes of ended transactions, so each change is committed."""
+
+    url = "/catalogue/api/records/changes/"
+
+    def get_changes(self, since=None, page_size=None):
+        """Return the changed and the deactivated identifiers since the token, and the next token."""
+        params = {"format": "json"}
+        if since:
+            params["since"] = since
+        if page_size:
+            params["page_size"] = page_size
+        changed, deactivated = [], []
+        while True:
+            resp = self.client.get(self.url, data=params)
+            self.assertEqual(resp.status_code, 200)
+            page = resp.json()
+            self.assertTrue(len(page["results"]) + len(page["deactivated"]) <= (page_size or settings.API_RECORDS_PAGE_SIZE))
+            changed.extend(r["identifier"] for r in page["results"])
+            deactivated.extend(page["deactivated"])
+            params["since"] = page["next"]
+            if not page["more"]:
+                return changed, deactivated, page["next"]
+
+    def test_changes(self):
+        records = mixer.cycle(5).blend(Record, title=mixer.RANDOM)
+        changed, deactivated, since = self.get_changes(page_size=2)
+        self.assertEqual(changed, [record.identifier for record in records])
+        self.assertEqual(self.get_changes(since), ([], [], since))
+
+        # Updates, tag changes and soft deletes are returned in the order of their transactions.
+        records[3].title = "Updated"
+        records[3].save()
+        records[1].tags.add(mixer.blend(Tag))
+        resp = self.client.delete("/catalogue/api/records/{}/".format(records[0].identifier))
+        self.assertEqual(resp.status_code, 204)
+        changed, deactivated, since = self.get_changes(since)
+        self.assertEqual(changed, [records[3].identifier, records[1].identifier])
+        self.assertEqual(deactivated, [records[0].identifier])
+        self.assertEqual(self.get_changes(since), ([], [], since))
+
+        resp = self.client.get(self.url, data={"since": "invalid"})
+        self.assertEqual(resp.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecordBulkAPITestCase(TestCase):
+    url = "/catalogue/api/records/bulk/"
+
+    def get_record_data(self, name, **kwargs):
+        data = {
+            "workspace": "test",
+            "name": name,
+            "title": name.title(),
+            "abstract": "Abstract",
+            "keywords": "a,b",
+            "bounding_box": "[115, -32, 116, -31]",
+            "crs": "EPSG:4326",
+            "publication_date": "2024-01-01 00:00:00.000000",
+            "service_type": "WMS",
+            "ows_resource": {"wms": True, "wms_endpoint": "https://example.com/wms", "wms_version": "1.1.1"},
+        }
+        data.update(kwargs)
+        return data
+
+    def post(self, records):
+        return self.client.post(self.url, json.dumps(records), content_type="application/json")
+
+    def test_bulk_upsert(self):
+        style = {"format": "SLD", "content": base64.b64encode(b"<StyledLayerDescriptor/>").decode()}
+        resp = self.post([self.get_record_data("roads", styles=[style], tags=["transport"]), self.get_record_data("rivers")])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([r["status"] for r in resp.json()["results"]], ["created", "created"])
+        record = Record.objects.get(identifier="test:roads")
+        self.assertEqual([t.name for t in record.tags.all()], ["transport"])
+        self.assertTrue(record.styles.get(format="SLD").default)
+        self.assertIn("application/sld", record.links)
+        self.assertEqual(list(record.record_links.values_list("protocol", "default")), [("OGC:WMS", False), ("application/sld", True)])
+        self.assertIn("<dc:title>Roads</dc:title>", record.full_xml)
+        self.assertEqual(record.bbox, [115, -32, 116, -31])
+
+        # Only the changed record is updated.
+        resp = self.post([self.get_record_data("roads", tags=["transport"]), self.get_record_data("rivers", keywords="a,b,c")])
+        self.assertEqual([r["status"] for r in resp.json()["results"]], ["unchanged", "updated"])
+        self.assertIn("<dc:subject>c</dc:subject>", Record.objects.get(identifier="test:rivers").summary_xml)
+
+    def test_bulk_update_legend(self):
+        """Test that the source legend of an existing record is replaced, and the replaced file deleted once saved"""
+        legend = {"ext": ".png", "content": base64.b64encode(b"legend").decode()}
+        self.post([self.get_record_data("roads", source_legend=legend)])
+        record = Record.objects.get(identifier="test:roads")
+        old_name = record.source_legend.name
+        storage = record.source_legend.storage
+        self.assertTrue(storage.exists(old_name))
+
+        legend = {"ext": ".png", "content": base64.b64encode(b"new legend").decode()}
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.post([self.get_record_data("roads", source_legend=legend)])
+        self.assertEqual([r["status"] for r in resp.json()["results"]], ["updated"])
+        record = Record.objects.get(identifier="test:roads")
+        self.assertNotEqual(record.source_legend.name, old_name)
+        self.assertEqual(record.source_legend.read(), b"new legend")
+        self.assertFalse(storage.exists(old_name))
+
+        # The source legend is removed if the record is posted without it.
+        old_name = record.source_legend.name
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.post([self.get_record_data("roads")])
+        self.assertEqual([r["status"] for r in resp.json()["results"]], ["updated"])
+        self.assertFalse(Record.objects.get(identifier="test:roads").source_legend)
+        self.assertFalse(storage.exists(old_name))
+
+    def test_regenerate_links(self):
+        """Test that regenerating the links of unchanged records gives the same links"""
+        style = {"format": "SLD", "content": base64.b64encode(b"<StyledLayerDescriptor/>").decode()}
+        ows_resource = {
+            "wms": True,
+            "wms_endpoint": "https://example.com/wms?SRS=EPSG:3857",
+            "wms_version": "1.1.1",
+            "wfs": True,
+            "wfs_endpoint": "https://example.com/wfs",
+            "wfs_version": "2.0.0",
+        }
+        self.post([self.get_record_data("roads", styles=[style], crs="EPSG:4283", ows_resource=ows_resource)])
+        links = Record.objects.get(identifier="test:roads").links
+        out = StringIO()
+        call_command("regenerate_links", workers=1, stdout=out)
+        self.assertIn("Regenerated the links of 0 of 1 records", out.getvalue())
+        with override_settings(BASE_URL="https://example.com"):
+            call_command("regenerate_links", workers=1, dry_run=True, stdout=out)
+            self.assertEqual(Record.objects.get(identifier="test:roads").links, links)
+            call_command("regenerate_links", workers=1, stdout=out)
+        self.assertIn("https://example.com/media/", Record.objects.get(identifier="test:roads").links)
+
+    def test_bulk_invalid(self):
+        resp = self.post([self.get_record_data("roads"), self.get_record_data("rivers", tags=["Not a slug"])])
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([r["status"] for r in resp.json()["results"]], ["valid", "invalid"])
+        self.assertFalse(Record.objects.exists())
+
+
+@override_settings(APPLICATION_VIEW_REFRESH_DELAY=0)
+class ApplicationRecordFeedTestCase(TestCase):
+    url = "/catalogue/api/application_records/"
+
+    def test_feed(self):
+        """Test that the application feed is served compressed and rebuilt when the application records change"""
+        application = mixer.blend(Application, name="test")
+        record = mixer.blend(Record, identifier="test:roads", title="Roads", links="", legend=None, active=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            application.records.add(record)
+            record.tags.add(mixer.blend(Tag, name="transport", description="Transport"))
+        resp = self.client.get(self.url, data={"application__name": "test"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(resp["Access-Control-Allow-Origin"], settings.CORS_URL)
+        rows = json.loads(gzip.decompress(resp.content))
+        self.assertEqual([row["identifier"] for row in rows], ["test:roads"])
+        self.assertEqual(rows[0]["tags"], [{"description": "Transport", "name": "transport"}])
+        # The feed isn't built again for each request.
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, data={"application__name": "test"}, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            application.records.add(mixer.blend(Record, identifier="test:rivers", links="", legend=None, active=False))
+        resp = self.client.get(self.url, data={"application__name": "test"})
+        self.assertEqual(len(json.loads(resp.content)), 2)
+        resp = self.client.get(self.url, data={"application__name": "missing"})
+        self.assertEqual(json.loads(resp.content), [])
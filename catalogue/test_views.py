@@ -0,0 +1,588 @@
+import threading
+from unittest import mock
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from lxml import etree
+from mixer.backend.django import mixer
+from pycsw.ogc.csw.csw2 import Csw2
+
+from catalogue import matviews
+from catalogue.cache import (
+    application_datasets_cache,
+    capabilities_cache,
+    catalogue_watermark,
+    pycsw_settings_cache,
+    reset_generations,
+    response_cache,
+)
+from catalogue.models import Application, CacheGeneration, Collaborator, Organization, PycswConfig, Record, Tag
+from catalogue.projections import TransformerRegistry, get_default_tile, get_gridset
+from catalogue.views import POST_PARSER, CswEndpoint, Repository, StreamedResults, build_pycsw_settings, build_server
+
+# A GetRecords response for the formatted number of records, with empty search results.
+GET_RECORDS_RESPONSE = (
+    '<csw:GetRecordsResponse xmlns:csw="http://www.opengis.net/cat/csw/2.0.2" version="2.0.2">'
+    '<csw:SearchStatus timestamp="2026-01-01T00:00:00Z"/><csw:SearchResults numberOfRecordsMatched="{0}" '
+    'numberOfRecordsReturned="{0}" nextRecord="0" recordSchema="http://www.opengis.net/cat/csw/2.0.2" elementSet="brief"/>'
+    "</csw:GetRecordsResponse>"
+)
+# The WSGI environment of a CSW request built outside the endpoint.
+CSW_ENV = {"REQUEST_METHOD": "POST", "QUERY_STRING": "", "SERVER_NAME": "testserver", "SERVER_PORT": "80", "wsgi.url_scheme": "http"}
+
+# A GetRecords request for the number of matching records, padded with the formatted argument.
+GET_RECORDS_HITS = (
+    '<csw:GetRecords xmlns:csw="http://www.opengis.net/cat/csw/2.0.2" service="CSW" version="2.0.2" resultType="hits">'
+    '<csw:Query typeNames="csw:Record"><csw:ElementSetName>brief</csw:ElementSetName></csw:Query>{}</csw:GetRecords>'
+)
+
+
+class PycswSettingsTestCase(TestCase):
+    def setUp(self):
+        pycsw_settings_cache.invalidate()
+        self.organization = mixer.blend(Organization, name="DBCA")
+        self.collaborator = mixer.blend(Collaborator, organization=self.organization)
+        mixer.blend(PycswConfig, point_of_contact=self.collaborator, repository_filter="", inspire_enabled=False)
+
+    def test_cached(self):
+        """Test that the pycsw settings are only built once per application"""
+        before = pycsw_settings_cache.stats()
+        build_pycsw_settings()
+        with self.assertNumQueries(0):
+            pycsw_settings = build_pycsw_settings()
+        self.assertEqual(pycsw_settings["metadata:main"]["provider_name"], "DBCA")
+        stats = pycsw_settings_cache.stats()
+        self.assertEqual(stats["hits"] - before["hits"], 1)
+        self.assertEqual(stats["misses"] - before["misses"], 1)
+        # Each application endpoint has its own entry.
+        self.assertNotEqual(build_pycsw_settings("test")["server"]["url"], pycsw_settings["server"]["url"])
+
+    def test_invalidated(self):
+        """Test that the cached pycsw settings are rebuilt after a related object changes"""
+        build_pycsw_settings()
+        self.organization.name = "Parks and Wildlife"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.save()
+        self.assertEqual(build_pycsw_settings()["metadata:main"]["provider_name"], "Parks and Wildlife")
+
+    def test_invalidated_by_other_worker(self):
+        """Test that the cached pycsw settings are rebuilt after another worker process invalidates them"""
+        build_pycsw_settings()
+        misses = pycsw_settings_cache.stats()["misses"]
+        CacheGeneration.objects.filter(name="pycsw_settings").update(generation=F("generation") + 1)
+        # As on the next request of this worker process.
+        reset_generations()
+        build_pycsw_settings()
+        self.assertEqual(pycsw_settings_cache.stats()["misses"], misses + 1)
+
+
+class CapabilitiesStoreTestCase(TestCase):
+    def test_capabilities_key(self):
+        """Test that only plain GetCapabilities requests are served from the store"""
+        endpoint = CswEndpoint()
+        kvp = {"service": "CSW", "request": "GetCapabilities", "version": "2.0.2"}
+        self.assertEqual(endpoint._get_capabilities_key("test", kvp), ("test", "CSW", "GetCapabilities", "2.0.2", "", "", ""))
+        self.assertIsNone(endpoint._get_capabilities_key(None, dict(kvp, updatesequence="1")))
+        self.assertIsNone(endpoint._get_capabilities_key(None, dict(kvp, request="GetRecords")))
+
+    def test_invalidated(self):
+        """Test that the capabilities store is cleared after an Application changes"""
+        capabilities_cache.get(("test",), lambda: b"<csw:Capabilities/>")
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend(Application, name="test")
+        self.assertEqual(capabilities_cache.stats()["size"], 0)
+
+    @mock.patch("catalogue.views.get_application_dataset", return_value=None)
+    @mock.patch.object(CswEndpoint, "_dispatch", return_value=("200 OK", "<csw:Capabilities/>"))
+    def test_endpoint(self, dispatch, get_application_dataset):
+        """Test that the GetCapabilities document is rendered again after the PycswConfig or an Application changes"""
+        config = create_pycsw_config()
+        capabilities_cache.invalidate()
+        url = reverse("csw_endpoint")
+        params = {"service": "CSW", "request": "GetCapabilities", "version": "2.0.2"}
+        self.client.get(url, params)
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.content, b"<csw:Capabilities/>")
+        self.assertEqual(dispatch.call_count, 1)
+        config.title = "Catalogue"
+        with self.captureOnCommitCallbacks(execute=True):
+            config.save()
+        self.client.get(url, params)
+        self.assertEqual(dispatch.call_count, 2)
+        self.assertEqual(dispatch.call_args.args[0].config.get("metadata:main", "identification_title"), "Catalogue")
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend(Application, name="test")
+        self.client.get(url, params)
+        self.client.get(url, params)
+        self.assertEqual(dispatch.call_count, 3)
+
+
+class ResponseCacheTestCase(TestCase):
+    @override_settings(APPLICATION_VIEW_REFRESH_DELAY=0)
+    def test_watermark(self):
+        """Test that the catalogue watermark changes when a record is deleted or added to an application"""
+        record = mixer.blend(Record, identifier="test", active=False)
+        application = mixer.blend(Application, name="test")
+        watermark = catalogue_watermark()
+        with self.captureOnCommitCallbacks(execute=True):
+            application.records.add(record)
+        self.assertNotEqual(catalogue_watermark(), watermark)
+        watermark = catalogue_watermark()
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        self.assertNotEqual(catalogue_watermark(), watermark)
+        # The tags are serialized with the records.
+        tag = mixer.blend(Tag, name="transport")
+        watermark = catalogue_watermark()
+        tag.name = "roads"
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertNotEqual(catalogue_watermark(), watermark)
+        # The counter bumped by another worker process is read again on the next request.
+        watermark = catalogue_watermark()
+        CacheGeneration.objects.filter(name="watermark").update(generation=F("generation") + 1)
+        self.assertEqual(catalogue_watermark(), watermark)
+        reset_generations()
+        self.assertNotEqual(catalogue_watermark(), watermark)
+
+    def test_cached_response(self):
+        """Test that a cached response is only served at the watermark it was rendered at"""
+        response_cache.set(("GET", "test"), "1", "200 OK", b"<csw:GetRecordsResponse/>")
+        self.assertEqual(response_cache.get(("GET", "test"), "1"), ("200 OK", b"<csw:GetRecordsResponse/>"))
+        self.assertIsNone(response_cache.get(("GET", "test"), "2"))
+
+    @mock.patch.object(CswEndpoint, "_dispatch", return_value=("200 OK", "<csw:GetRecordsResponse/>"))
+    def test_endpoint(self, dispatch):
+        """Test that a GetRecords response is served from the cache until the catalogue changes"""
+        create_pycsw_config()
+        record = mixer.blend(Record, identifier="test:layer", active=False)
+        url = reverse("csw_endpoint")
+        body = GET_RECORDS_HITS.format("")
+        self.client.post(url, body, content_type="application/xml")
+        resp = self.client.post(url, body, content_type="application/xml")
+        self.assertEqual(resp.content, b"<csw:GetRecordsResponse/>")
+        self.assertEqual(dispatch.call_count, 1)
+        # The attribute order and quoting don't change the cached request.
+        self.client.post(
+            url, body.replace(' service="CSW" version="2.0.2"', " version='2.0.2' service='CSW'"), content_type="application/xml"
+        )
+        self.assertEqual(dispatch.call_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            record.save()
+        self.client.post(url, body, content_type="application/xml")
+        self.assertEqual(dispatch.call_count, 2)
+
+        def exception_report(server):
+            server.exception = True
+            return "200 OK", "<ows:ExceptionReport/>"
+
+        dispatch.side_effect = exception_report
+        body = GET_RECORDS_HITS.format("<csw:Test/>")
+        self.client.post(url, body, content_type="application/xml")
+        resp = self.client.post(url, body, content_type="application/xml")
+        self.assertEqual(resp.content, b"<ows:ExceptionReport/>")
+        self.assertEqual(dispatch.call_count, 4)
+
+
+def create_pycsw_config():
+    """
+    Create the PycswConfig of the CSW endpoints, discarding the settings cached for a previous test.
+    """
+    pycsw_settings_cache.invalidate()
+    collaborator = mixer.blend(Collaborator, organization=mixer.blend(Organization))
+    return mixer.blend(PycswConfig, point_of_contact=collaborator, repository_filter="", inspire_enabled=False)
+
+
+class PostRequestTestCase(TestCase):
+    def setUp(self):
+        create_pycsw_config()
+
+    @override_settings(CSW_MAX_POST_SIZE=100)
+    def test_max_size(self):
+        """Test that a POST request body larger than the maximum size is rejected before it is parsed"""
+        body = '<csw:GetRecords xmlns:csw="http://www.opengis.net/cat/csw/2.0.2" service="CSW" version="2.0.2">{}</csw:GetRecords>'
+        resp = self.client.post(reverse("csw_endpoint"), body.format(" " * 100), content_type="application/xml")
+        self.assertEqual(resp.status_code, 413)
+
+    @mock.patch.object(CswEndpoint, "_dispatch", return_value=("200 OK", b"<csw:GetRecordsResponse/>"))
+    def test_large_body(self, dispatch):
+        """Test that a POST request body under the maximum size is read, even if larger than Django's default limit"""
+        body = GET_RECORDS_HITS.format(" " * 3 * 1024 * 1024)
+        resp = self.client.post(reverse("csw_endpoint"), body, content_type="application/xml")
+        self.assertEqual(resp.status_code, 200)
+        server = dispatch.call_args.args[0]
+        self.assertEqual(len(server.request), len(body))
+        self.assertEqual(etree.QName(server.document).localname, "GetRecords")
+
+    def test_parsed_once(self):
+        """Test that pycsw validates the document parsed by the endpoint, rather than parsing the request body again"""
+        body = GET_RECORDS_HITS.format("").encode()
+        server = build_server(env=CSW_ENV, version="2.0.2")
+        server.document = etree.fromstring(body, POST_PARSER)
+        with mock.patch("lxml.etree.fromstring", wraps=etree.fromstring) as fromstring:
+            kvp = server.iface.parse_postdata(body)
+        self.assertEqual(kvp["request"], "GetRecords")
+        self.assertEqual(kvp["resulttype"], "hits")
+        self.assertFalse([c for c in fromstring.call_args_list if c.args[0] == body])
+        # The handed-off document is still validated against the CSW schemas.
+        body = GET_RECORDS_HITS.format("<csw:Test/>").encode()
+        server.document = etree.fromstring(body, POST_PARSER)
+        self.assertIn("the document is not valid", server.iface.parse_postdata(body))
+
+    def test_entities_not_resolved(self):
+        """Test that the external entities of a POST request are neither resolved nor fetched"""
+        body = (
+            b'<?xml version="1.0"?><!DOCTYPE foo [<!ENTITY xxe SYSTEM "file:///etc/passwd">]>'
+            b'<csw:GetRecordById xmlns:csw="http://www.opengis.net/cat/csw/2.0.2" service="CSW" version="2.0.2">'
+            b"<csw:Id>&xxe;</csw:Id></csw:GetRecordById>"
+        )
+        document = etree.fromstring(body, POST_PARSER)
+        self.assertEqual(document.findtext("{http://www.opengis.net/cat/csw/2.0.2}Id"), "")
+        server = build_server(env=CSW_ENV, version="2.0.2")
+        server.document = document
+        self.assertNotIn("root:", str(server.iface.parse_postdata(body)))
+
+    @override_settings(CSW_POST_LOG_SIZE=20)
+    @mock.patch.object(CswEndpoint, "_dispatch", return_value=("200 OK", b"<csw:GetRecordsResponse/>"))
+    def test_log_truncated(self, dispatch):
+        """Test that only the leading bytes of a POST request body are logged"""
+        body = GET_RECORDS_HITS.format("")
+        with self.assertLogs("catalogue.views", "INFO") as logs:
+            self.client.post(reverse("csw_endpoint"), body, content_type="application/xml")
+        self.assertTrue(logs.output[0].endswith("CSW POST GetRecords request ({} bytes): {}".format(len(body), body[:20])))
+
+
+class StreamingTestCase(TestCase):
+    def setUp(self):
+        create_pycsw_config()
+
+    def test_can_stream(self):
+        """Test that only csw:Record GetRecords results are streamed"""
+        endpoint = CswEndpoint()
+        kvp = {"service": "CSW", "request": "GetRecords", "version": "2.0.2", "typenames": "csw:Record", "resulttype": "results"}
+        self.assertTrue(endpoint._can_stream(kvp))
+        self.assertFalse(endpoint._can_stream(dict(kvp, resulttype="hits")))
+        self.assertFalse(endpoint._can_stream(dict(kvp, outputschema="http://www.isotc211.org/2005/gmd")))
+        self.assertFalse(endpoint._can_stream(dict(kvp, outputformat="application/json")))
+
+    def dispatch(self, server):
+        """
+        Respond to the GetRecords request as pycsw does, with the matching records written in the search
+        results, unless the repository deferred loading them for the response to be streamed.
+        """
+        # pycsw switches to the CSW interface of the requested version.
+        server.iface = Csw2(server_csw=server)
+        records = list(Record.objects.order_by("identifier"))
+        root = etree.fromstring(GET_RECORDS_RESPONSE.format(len(records)))
+        if server.stream_results:
+            query = mock.Mock()
+            query.with_session.return_value.yield_per.return_value = records
+            server.streamed_results = StreamedResults(query)
+            server.repository = mock.Mock(queryables={"_all": {}}, engine=None)
+        else:
+            for record in records:
+                root.find("{*}SearchResults").append(server.iface._write_record(record, {}))
+        return "200 OK", etree.tostring(root, xml_declaration=True, encoding=server.encoding, standalone=False)
+
+    @override_settings(CSW_STREAM_MIN_RECORDS=5)
+    @mock.patch("catalogue.views.get_application_dataset", return_value=None)
+    def test_stream(self, get_application_dataset):
+        """Test that a streamed GetRecords response is the document of the unstreamed response"""
+        for i in range(5):
+            mixer.blend(Record, identifier="test:layer{}".format(i), title="Layer {}".format(i), active=False)
+        params = {
+            "service": "CSW",
+            "version": "2.0.2",
+            "request": "GetRecords",
+            "typenames": "csw:Record",
+            "resulttype": "results",
+            "elementsetname": "brief",
+            "maxrecords": "5",
+        }
+        with mock.patch.object(CswEndpoint, "_dispatch", side_effect=self.dispatch):
+            resp = self.client.get(reverse("csw_endpoint"), params)
+            self.assertIsInstance(resp, StreamingHttpResponse)
+            streamed = etree.fromstring(b"".join(resp.streaming_content))
+            with override_settings(CSW_STREAM_MIN_RECORDS=0):
+                resp = self.client.get(reverse("csw_endpoint"), params)
+            self.assertNotIsInstance(resp, StreamingHttpResponse)
+            unstreamed = etree.fromstring(resp.content)
+        searchresults = streamed.find("{*}SearchResults")
+        self.assertEqual(searchresults.get("numberOfRecordsMatched"), "5")
+        self.assertEqual(searchresults.get("nextRecord"), "0")
+        self.assertEqual([e.findtext("{*}identifier") for e in searchresults], ["test:layer{}".format(i) for i in range(5)])
+        self.assertEqual(etree.tostring(streamed, method="c14n"), etree.tostring(unstreamed, method="c14n"))
+
+
+class RecordFragmentsTestCase(TestCase):
+    def test_fragments(self):
+        """Test that the csw:Record fragments are built when a record is saved"""
+        record = mixer.blend(Record, identifier="test:layer", title="Layer", keywords="a,b", bounding_box=None)
+        self.assertIn("<csw:BriefRecord", record.brief_xml)
+        self.assertIn("<dc:identifier>test:layer</dc:identifier>", record.brief_xml)
+        self.assertIn("<dc:subject>b</dc:subject>", record.summary_xml)
+        self.assertNotIn("<dc:subject>", record.brief_xml)
+        record.title = "Renamed"
+        record.save(update_fields=["title"])
+        record.refresh_from_db()
+        self.assertIn("<dc:title>Renamed</dc:title>", record.full_xml)
+
+
+class RecordLinksTestCase(TestCase):
+    def test_parsed_links(self):
+        """Test that the links of a record are parsed once, until its links column changes"""
+        ows_link = 'None\tNone\t{"protocol": "OGC:WMS", "linkage": "https://example.com/ows"}\thttps://example.com/ows?service=WMS'
+        style_link = 'None\tNone\t{"protocol": "application/sld", "name": "style"}\thttps://example.com/style.sld'
+        record = Record(identifier="test:layer", links=Record.format_links([ows_link, style_link]))
+        links = record.parsed_links
+        self.assertIs(record.parsed_links, links)
+        self.assertEqual(record.ows_links, [ows_link])
+        self.assertEqual(links[1].schema["name"], "style")
+        self.assertEqual(Record.format_links(links), record.links)
+        record.links = ows_link
+        self.assertEqual(len(record.parsed_links), 1)
+
+
+class FullTextSearchTestCase(TestCase):
+    def test_anytext_tsvector(self):
+        """Test that the full-text vector of a record is updated with its columns and tags"""
+        record = mixer.blend(Record, identifier="test:layer", title="Roads", abstract="", keywords="", any_text="", active=False)
+        matches = Record.objects.filter(pk=record.pk)
+        self.assertTrue(matches.filter(anytext_tsvector="road").exists())
+        self.assertFalse(matches.filter(anytext_tsvector="bushfire").exists())
+        record.tags.add(mixer.blend(Tag, name="fire", description="Bushfire"))
+        self.assertTrue(matches.filter(anytext_tsvector="bushfire").exists())
+
+
+class SpatialPrefilterTestCase(TestCase):
+    def test_extent(self):
+        """Test that the extent columns of a record are updated on save"""
+        record = mixer.blend(
+            Record, identifier="test:layer", bounding_box="POLYGON((0 0, 0 1000, 1000 1000, 1000 0, 0 0))", crs="EPSG:3857", active=False
+        )
+        self.assertEqual(record.bbox, [0, 0, 1000, 1000])
+        self.assertAlmostEqual(record.wgs84_maxx, 0.008983, places=6)
+        record.bbox[0] = 10
+        self.assertEqual(record.bbox[0], 0)
+
+    def test_projected_extents(self):
+        """Test that the ows links read the extent and preview tile stored for their crs"""
+        record = mixer.blend(
+            Record,
+            identifier="test:layer",
+            bounding_box="POLYGON((115 -32, 115 -31, 116 -31, 116 -32, 115 -32))",
+            crs="EPSG:4326",
+            active=False,
+        )
+        bbox, tile = record.get_extent("EPSG:3857")
+        self.assertAlmostEqual(bbox[0], 12801741.0, places=0)
+        link = record.generate_ows_link("https://example.com/gwc/service/wms?SRS=EPSG:3857", "GWC", "1.1.1")
+        self.assertIn("BBOX={}".format(", ".join(str(c) for c in tile)), link)
+        # The stored extents are not transformed again.
+        record.extents["EPSG:3857"] = {"bbox": [0, 0, 1, 1], "tile": [0, 0, 2, 2]}
+        self.assertIn("BBOX=0, 0, 2, 2", record.generate_ows_link("https://example.com/gwc/service/wms?SRS=EPSG:3857", "GWC", "1.1.1"))
+
+    def test_prototype_session_closed(self):
+        """Test that the session of a prototype repository doesn't keep a pooled connection"""
+        context = type("Context", (), {"server": type("Server", (), {"request_version": "2.0.2"})})
+        with mock.patch("catalogue.views.PyCswRepository"), mock.patch.object(Repository, "get_engine"):
+            prototype = Repository.get_prototype("postgresql://test", "test_table", None, context)
+            self.assertIs(Repository.get_prototype("postgresql://test", "test_table", None, context), prototype)
+        prototype.session.close.assert_called_once_with()
+        Repository._prototypes.pop(("postgresql://test", "test_table", None, "2.0.2"))
+
+    def test_prefilter(self):
+        """Test that only the spatial queries which require overlapping extents are pre-filtered"""
+        repository = Repository.__new__(Repository)
+        repository.extent = True
+        repository.context = type("Context", (), {"md_core_model": {"mappings": {"pycsw:BoundingBox": "bounding_box"}}})
+        wkt = "POLYGON((115 -32, 115 -31, 116 -31, 116 -32, 115 -32))"
+        where = repository._prefilter_spatial({"where": "query_spatial(bounding_box,'{}','bbox','false')".format(wkt)})["where"]
+        self.assertTrue(
+            where.startswith(
+                "(box(point(bbox_minx, bbox_miny), point(bbox_maxx, bbox_maxy)) && box(point(115.0, -32.0), point(116.0, -31.0)) and"
+            )
+        )
+        where = "query_spatial(bounding_box,'{}','disjoint','false')".format(wkt)
+        self.assertEqual(repository._prefilter_spatial({"where": where})["where"], where)
+
+
+class TransformerRegistryTestCase(TestCase):
+    def test_registry(self):
+        """Test that the transformers are cached per CRS pair, up to the registry size"""
+        registry = TransformerRegistry(maxsize=2)
+        self.assertIs(registry.get("EPSG:4326", "EPSG:3857"), registry.get("epsg:4326", "EPSG:3857"))
+        registry.get("EPSG:4326", "EPSG:900913")
+        registry.get("EPSG:4326", "EPSG:4283")
+        self.assertEqual(len(registry), 2)
+        # EPSG:900913 is defined in catalogue/data/epsg.
+        self.assertIn("EPSG:900913", registry.custom_crs)
+
+    def test_transform_bounds(self):
+        """Test that the transformed bbox covers the whole bbox, not only its corners"""
+        registry = TransformerRegistry()
+        bbox = registry.transform_bounds("EPSG:4326", "EPSG:28350", [112, -36, 120, -30])
+        minx, miny = registry.get("EPSG:4326", "EPSG:28350").transform(112, -36)
+        self.assertLess(bbox[0], minx)
+        self.assertEqual(registry.transform_bounds("EPSG:4326", "epsg:4326", [112, -36, 120, -30]), [112, -36, 120, -30])
+
+
+class GridsetTestCase(TestCase):
+    def test_covering_tile(self):
+        """Test that the covering tile is the smallest gridset tile containing the bbox"""
+        gridset = get_gridset("epsg:4326")
+        self.assertEqual(gridset.covering_tile([115, -32, 116, -31]), (112.5, -33.75, 118.125, -28.125))
+        # A bbox across the middle of the gridset is only covered by the zoom level 0 tile.
+        self.assertEqual(gridset.covering_tile([80, -10, 100, 10]), (0, -90, 180, 90))
+        bboxes = [[115, -32, 116, -31], [80, -10, 100, 10], [115.5, -31.5, 115.5001, -31.4999]]
+        self.assertEqual(
+            [tuple(tile) for tile in gridset.covering_tiles(bboxes).tolist()], [gridset.covering_tile(bbox) for bbox in bboxes]
+        )
+
+    def test_default_tile(self):
+        """Test that the default tile covers Australia and is computed once per gridset"""
+        gridset = get_gridset("EPSG:3857")
+        tile = gridset.default_tile()
+        minx, miny, maxx, maxy = TransformerRegistry().transform_bounds("EPSG:4326", "EPSG:3857", [108.0, -45.0, 155.0, -10.0])
+        self.assertTrue(tile[0] <= minx and tile[1] <= miny and tile[2] >= maxx and tile[3] >= maxy)
+        hits = get_default_tile.cache_info().hits
+        self.assertEqual(get_gridset("EPSG:3857").default_tile(), tile)
+        self.assertEqual(get_default_tile.cache_info().hits, hits + 1)
+
+    @override_settings(GWC_GRIDSETS={"EPSG:28350": {"bounds": [0, 6000000, 1000000, 7000000], "max_zoom": 10, "tile_size": 256}})
+    def test_configured_gridset(self):
+        """Test that the GWC links are generated for the configured gridsets"""
+        record = Record(identifier="test:layer", bounding_box="POLYGON((115 -32, 115 -31, 116 -31, 116 -32, 115 -32))", crs="EPSG:4326")
+        record.update_extent()
+        link = record.generate_ows_link("https://example.com/gwc/service/wms?SRS=EPSG:28350", "GWC", "1.1.1")
+        self.assertIn("WIDTH=256", link)
+        self.assertIsNone(get_gridset("EPSG:3857"))
+
+
+@override_settings(APPLICATION_VIEW_REFRESH_DELAY=0)
+class ApplicationViewsTestCase(TestCase):
+    def get_view_identifiers(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT identifier FROM {} ORDER BY identifier".format(Application.get_view_name(name)))
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_refresh(self):
+        """Test that the records view of an application is created and refreshed when its records change"""
+        application = mixer.blend(Application, name="test")
+        record = mixer.blend(Record, identifier="test:layer", title="Layer", active=False)
+        self.assertEqual(self.get_view_identifiers("test"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            application.records.add(record)
+        self.assertEqual(self.get_view_identifiers("test"), ["test:layer"])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s", [Application.get_view_name("test")])
+            self.assertTrue(any("gin (anytext_tsvector)" in row[0] for row in cursor.fetchall()))
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        self.assertEqual(self.get_view_identifiers("test"), [])
+
+    @override_settings(APPLICATION_VIEW_REFRESH_DELAY=60)
+    def test_refresh_pending(self):
+        """Test that a refresh which a worker process didn't run is run from the pending flag"""
+        application = mixer.blend(Application, name="test")
+        record = mixer.blend(Record, identifier="test:layer", title="Layer", active=False)
+        # The changes are committed, but the worker process exits before its timer runs.
+        with mock.patch.object(matviews.view_refresher, "schedule"):
+            with self.captureOnCommitCallbacks(execute=True):
+                application.records.add(record)
+        self.assertEqual(self.get_view_identifiers("test"), [])
+        self.assertTrue(Application.objects.get(pk=application.pk).view_refresh_pending)
+        self.assertEqual(matviews.refresh_pending(), ["test"])
+        self.assertEqual(self.get_view_identifiers("test"), ["test:layer"])
+        self.assertFalse(Application.objects.get(pk=application.pk).view_refresh_pending)
+
+    def test_rename(self):
+        """Test that the records view is renamed and dropped with its application"""
+        application = mixer.blend(Application, name="test")
+        application.name = "renamed"
+        application.save()
+        self.assertEqual(self.get_view_identifiers("renamed"), [])
+        application.delete()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_matviews WHERE matviewname LIKE 'catalogue_record_%%'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_rebuild(self):
+        """Test that the rebuilt records views have the current columns of the records table"""
+        application = mixer.blend(Application, name="test")
+        matviews.drop_view("test")
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE MATERIALIZED VIEW catalogue_record_test AS SELECT id, identifier FROM catalogue_record")
+        matviews.rebuild_views([application])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT * FROM catalogue_record_test")
+            self.assertIn("change_xid", [column.name for column in cursor.description])
+
+    def test_replace_plain_view(self):
+        """Test that the plain records view of an application created before the materialized views is replaced"""
+        application = mixer.blend(Application, name="test")
+        matviews.drop_view("test")
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE VIEW catalogue_record_test AS SELECT * FROM catalogue_record")
+        matviews.drop_view("test")
+        matviews.create_view(application)
+        self.assertTrue(matviews.view_exists("test"))
+
+
+class ApplicationViewsRefreshTestCase(TransactionTestCase):
+    def get_view_titles(self):
+        titles = []
+
+        def read():
+            # Read the view from another connection, as a CSW query would.
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT title FROM catalogue_record_test")
+                    titles.extend(row[0] for row in cursor.fetchall())
+            finally:
+                connection.close()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(10)
+        self.assertFalse(reader.is_alive())
+        return titles
+
+    def test_refresh_concurrent_writes(self):
+        """Test that refreshing a records view blocks neither the writes to the records nor the queries of the view"""
+        application = mixer.blend(Application, name="test")
+        self.addCleanup(application.delete)
+        record = mixer.blend(Record, identifier="test:layer", title="Layer", active=False)
+        with mock.patch.object(matviews.view_refresher, "schedule"):
+            application.records.add(record)
+        matviews.refresh_views(["test"])
+
+        def write():
+            try:
+                Record.objects.filter(pk=record.pk).update(title="Renamed")
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            # The view stays locked by the refresh until the transaction is committed.
+            matviews.refresh_views(["test"])
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(10)
+            self.assertFalse(writer.is_alive())
+            self.assertEqual(self.get_view_titles(), ["Layer"])
+        self.assertEqual(self.get_view_titles(), ["Layer"])
+        matviews.refresh_views(["test"])
+        self.assertEqual(self.get_view_titles(), ["Renamed"])
+
+
+class ApplicationDatasetsTestCase(TestCase):
+    def test_invalidated(self):
+        """Test that the reflected application views are discarded after an Application is created"""
+        application_datasets_cache.get(("test", "all"), lambda: object())
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend(Application, name="test")
+        self.assertEqual(application_datasets_cache.stats()["size"], 0)
@@ -2,12 +2,13 @@ from django.urls import include, path
 from rest_framework import routers
 
 from catalogue import views
-from catalogue.api import RecordViewSet
+from catalogue.api import RecordViewSet, application_record
 
 router = routers.DefaultRouter()
 router.register("records", RecordViewSet)
 
 urlpatterns = [
+    path("api/application_records/", application_record, name="application_records"),
     path("api/", include(router.urls)),
     path("<str:app>/", views.CswEndpoint.as_view(), name="csw_app_endpoint"),
     path("", views.CswEndpoint.as_view(), name="csw_endpoint"),
@@ -1,32 +1,145 @@
+import configparser
+import copy
+import functools
 import logging
+import operator
 import os.path
+import re
+import threading
+import uuid
 from itertools import chain
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.views.generic import View
 from lxml import etree
 from pycsw.core import util
-from pycsw.ogc.csw.csw3 import write_boundingbox
+from pycsw.core.repository import Repository as PyCswRepository
+from pycsw.ogc.csw import csw2, csw3
+from pycsw.ogc.csw.csw2 import Csw2
 from pycsw.server import Csw as PyCsw
-from sqlalchemy import inspection, log
+from sqlalchemy import create_engine, func, inspection, log, text
 from sqlalchemy import util as sqlalchemy_util
+from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Query, create_session
 from sqlalchemy.orm.mapper import Mapper as BaseMapper
 from sqlalchemy.sql import util as sql_util
 
+from catalogue import fragments
+from catalogue.cache import (
+    application_datasets_cache,
+    bump_watermark_counter,
+    capabilities_cache,
+    catalogue_watermark,
+    get_request_version,
+    pycsw_settings_cache,
+    response_cache,
+)
 from catalogue.models import Application, PycswConfig
 
 LOGGER = logging.getLogger(__name__)
 
 
 def build_pycsw_settings(app=None):
-    """FIXME: I have no idea what the utility or intent of this function is."""
+    """
+    Return the pycsw runtime configuration for the CSW endpoint of `app` (or the
+    default endpoint). The configuration is cached per application in each worker
+    and invalidated when PycswConfig, Collaborator or Organization change.
+    """
+    return copy.deepcopy(pycsw_settings_cache.get(app or "", lambda: _build_pycsw_settings(app)))
+
+
+def get_pycsw_config(app=None):
+    """
+    Return the parsed pycsw configuration for `app`, shared by every request to
+    the endpoint so that pycsw doesn't parse its configuration for each request.
+    Invalidated together with the cached pycsw settings.
+    """
+
+    def build():
+        # Disable interpolation, as the database URL may contain "%" characters.
+        config = configparser.ConfigParser(interpolation=None)
+        for section, options in build_pycsw_settings(app).items():
+            config.add_section(section)
+            for k, v in options.items():
+                config.set(section, k, v)
+        return config
+
+    return pycsw_settings_cache.get(("config", app or ""), build)
+
+
+def build_server(app=None, env=None, version="3.0.0"):
+    """
+    Return a pycsw server for a single request to the endpoint of `app`, using
+    the shared configuration and the pooled repository.
+    """
+    return Csw(rtconfig=get_pycsw_config(app), env=env, version=version)
+
+
+# The parser of POST request documents, which doesn't resolve entities or access the network.
+POST_PARSER = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
+
+
+def get_repository_database():
+    """Return the database URL of the pycsw repository."""
+    return os.environ.get("DATABASE_URL", "").replace("postgis", "postgresql")
+
+
+def get_application_dataset(app, database):
+    """
+    Return the ORM class of the records view of `app`, reflected once per worker
+    process, or None if the view can't be reflected. The registry is cleared when
+    an Application is created or deleted.
+    The "all" view is used for requests without an application, if an Application
+    named "all" exists; otherwise those requests query the records table.
+    """
+    return application_datasets_cache.get((database, app), lambda: _reflect_application_dataset(app, database)) or None
+
+
+def _reflect_application_dataset(app, database):
+    try:
+        base = declarative_base(bind=Repository.get_engine(database), mapper=Mapper)
+        return type(
+            "dataset",
+            (base,),
+            dict(
+                __tablename__=Application.get_view_name(app),
+                __table_args__={"autoload": True, "schema": None},
+                __mapper_args__={"primary_key": ["id"]},
+            ),
+        )
+    except NoSuchTableError:
+        if app == "all":
+            # Remember there is no "all" view, until an Application is created.
+            return False
+        LOGGER.warning("The records view of the application {} doesn't exist".format(app))
+        return None
+    except Exception:
+        LOGGER.exception("Failed to reflect the records view of the application {}".format(app))
+        return None
+
+
+def warm_up():
+    """
+    Reflect the records views of every application, e.g. when a worker process starts.
+    """
+    database = get_repository_database()
+    try:
+        for app in chain(["all"], Application.objects.values_list("name", flat=True)):
+            get_application_dataset(app, database)
+    except Exception:
+        LOGGER.exception("Failed to reflect the application records views")
+
+
+def _build_pycsw_settings(app=None):
+    """Build the pycsw runtime configuration from the PycswConfig object."""
     config = PycswConfig.objects.first()
     if not config:
         config = PycswConfig()
@@ -39,8 +152,9 @@ def build_pycsw_settings(app=None):
     poc = config.point_of_contact
     org = poc.organization
     record_table = "public.catalogue_record"
-    db_connection = os.environ.get("DATABASE_URL", "").replace("postgis", "postgresql")
-    mappings_path = os.path.join(apps.get_app_config("catalogue").path, "mappings.py")
+    db_connection = get_repository_database()
+    # Use the dotted module name, so pycsw imports the mappings once rather than loading the file for every request.
+    mappings_module = "{}.mappings".format(apps.get_app_config("catalogue").name)
 
     pycsw_settings = {
         "server": {
@@ -82,8 +196,9 @@ def build_pycsw_settings(app=None):
         },
         "repository": {
             "database": db_connection,
-            "mappings": mappings_path,
+            "mappings": mappings_module,
             "table": record_table,
+            "source": "catalogue.views.Repository",
         },
         "metadata:inspire": {
             "enabled": "true" if config.inspire_enabled else "false",
@@ -105,92 +220,289 @@ def build_pycsw_settings(app=None):
 
 
 class Csw(PyCsw):
+    def __init__(self, *args, **kwargs):
+        super(Csw, self).__init__(*args, **kwargs)
+        # pycsw only switches to SQLAlchemy query parameters for its default repository.
+        self.orm = "sqlalchemy"
+
+    @property
+    def iface(self):
+        return self._iface
+
+    # The POST request document, if it was already parsed by the endpoint.
+    document = None
+
+    @iface.setter
+    def iface(self, iface):
+        # pycsw writes records with the method of its CSW interface; use the catalogue's for CSW 2.0.2.
+        if isinstance(iface, Csw2):
+            iface._write_record = self._write_record
+        iface.parse_postdata = functools.partial(self._parse_postdata, iface.parse_postdata)
+        self._iface = iface
+
+    def _parse_postdata(self, parse_postdata, postdata):
+        """
+        Parse the POST request with the pycsw method, handing it the document parsed by the endpoint.
+        pycsw validates that document against the CSW schemas where it would, rather than parsing the
+        request body again.
+        """
+        if self.document is None:
+            return parse_postdata(postdata)
+        body = RequestBody(postdata)
+        body.document = self.document
+        return parse_postdata(body)
+
     def _write_record(self, recobj, queryables):
-        """replicate from original method.
-        Only changes is the column separator in links is "\t" instead of ","
         """
-        if self.kvp["elementsetname"] == "brief":
-            elname = "BriefRecord"
-        elif self.kvp["elementsetname"] == "summary":
-            elname = "SummaryRecord"
-        else:
-            elname = "Record"
-
-        record = etree.Element(util.nspath_eval("csw:%s" % elname, self.context.namespaces))
-
-        if "elementname" in self.kvp and len(self.kvp["elementname"]) > 0:
-            for elemname in self.kvp["elementname"]:
-                if elemname.find("BoundingBox") != -1 or elemname.find("Envelope") != -1:
-                    bboxel = write_boundingbox(
-                        util.getqattr(recobj, self.context.md_core_model["mappings"]["pycsw:BoundingBox"]), self.context.namespaces
-                    )
-                    if bboxel is not None:
-                        record.append(bboxel)
-                else:
-                    value = util.getqattr(recobj, queryables[elemname]["dbcol"])
-                    if value:
-                        etree.SubElement(record, util.nspath_eval(elemname, self.context.namespaces)).text = value
-        elif "elementsetname" in self.kvp:
-            if (
-                self.kvp["elementsetname"] == "full"
-                and util.getqattr(recobj, self.context.md_core_model["mappings"]["pycsw:Typename"]) == "csw:Record"
-                and util.getqattr(recobj, self.context.md_core_model["mappings"]["pycsw:Schema"]) == "http://www.opengis.net/cat/csw/2.0.2"
-                and util.getqattr(recobj, self.context.md_core_model["mappings"]["pycsw:Type"]) != "service"
-            ):
-                # dump record as is and exit
-                return etree.fromstring(util.getqattr(recobj, self.context.md_core_model["mappings"]["pycsw:XML"]), self.context.parser)
-
-            etree.SubElement(record, util.nspath_eval("dc:identifier", self.context.namespaces)).text = util.getqattr(
-                recobj, self.context.md_core_model["mappings"]["pycsw:Identifier"]
-            )
+        Write a csw:Record element, parsed from the fragment precomputed when the record was saved if there is one.
+        """
+        fragment = self._get_fragment(recobj)
+        if fragment:
+            return etree.fromstring(fragment, self.context.parser)
+        return fragments.write_record(recobj, self.kvp, self.context, queryables)
 
-            for i in ["dc:title", "dc:type"]:
-                val = util.getqattr(recobj, queryables[i]["dbcol"])
-                if not val:
-                    val = ""
-                etree.SubElement(record, util.nspath_eval(i, self.context.namespaces)).text = val
-
-            if self.kvp["elementsetname"] in ["summary", "full"]:
-                # add summary elements
-                keywords = util.getqattr(recobj, queryables["dc:subject"]["dbcol"])
-                if keywords is not None:
-                    for keyword in keywords.split(","):
-                        etree.SubElement(record, util.nspath_eval("dc:subject", self.context.namespaces)).text = keyword
-
-                val = util.getqattr(recobj, queryables["dc:format"]["dbcol"])
-                if val:
-                    etree.SubElement(record, util.nspath_eval("dc:format", self.context.namespaces)).text = val
-
-                # links
-                rlinks = util.getqattr(recobj, self.context.md_core_model["mappings"]["pycsw:Links"])
-
-                if rlinks:
-                    links = rlinks.split("^")
-                    for link in links:
-                        linkset = link.split("\t")
-                        etree.SubElement(
-                            record, util.nspath_eval("dct:references", self.context.namespaces), scheme=linkset[2].replace('"', "&quot;")
-                        ).text = linkset[-1]
-
-                for i in ["dc:relation", "dct:modified", "dct:abstract"]:
-                    val = util.getqattr(recobj, queryables[i]["dbcol"])
-                    if val is not None:
-                        etree.SubElement(record, util.nspath_eval(i, self.context.namespaces)).text = val
-
-            if self.kvp["elementsetname"] == "full":  # add full elements
-                for i in ["dc:date", "dc:creator", "dc:publisher", "dc:contributor", "dc:source", "dc:language", "dc:rights"]:
-                    val = util.getqattr(recobj, queryables[i]["dbcol"])
-                    if val:
-                        etree.SubElement(record, util.nspath_eval(i, self.context.namespaces)).text = val
-
-            # always write out ows:BoundingBox
-            bboxel = write_boundingbox(
-                getattr(recobj, self.context.md_core_model["mappings"]["pycsw:BoundingBox"]), self.context.namespaces
+    def _get_fragment(self, recobj):
+        """
+        Return the precomputed fragment of the record for the requested element set, or None.
+        """
+        field = fragments.ELEMENT_SETS.get(self.kvp.get("elementsetname"))
+        if field is None or self.kvp.get("elementname"):
+            return None
+        return util.getqattr(recobj, field) or None
+
+    def write_record_bytes(self, recobj, queryables):
+        """
+        Return the serialized csw:Record element, using the precomputed fragment as is if there is one.
+        """
+        fragment = self._get_fragment(recobj)
+        if fragment:
+            return fragment.encode(self.encoding)
+        return fragments.serialize(self._write_record(recobj, queryables), self.context.namespaces, encoding=self.encoding)
+
+
+class RequestBody(bytes):
+    """
+    The body of a POST request, carrying the document the endpoint already parsed from it.
+    """
+
+    document = None
+
+
+class SchemaParser(etree.XMLParser):
+    """
+    An XML parser which keeps the schema it validates documents against.
+    """
+
+    def __init__(self, schema=None, **kwargs):
+        super(SchemaParser, self).__init__(schema=schema, **kwargs)
+        self.schema = schema
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema(file):
+    """
+    Return the XML schema at the path `file`, parsed once per worker process.
+    """
+    return etree.XMLSchema(file=file)
+
+
+class RequestEtree(object):
+    """
+    The lxml etree module as used by the pycsw CSW interfaces. Parsing a RequestBody returns the
+    document the endpoint already parsed from it, validated against the schema of the parser if it
+    has one, so that the request body is only tokenized once. The CSW schemas are parsed once.
+    """
+
+    XMLParser = SchemaParser
+
+    def __getattr__(self, name):
+        return getattr(etree, name)
+
+    @staticmethod
+    def fromstring(text, parser=None, **kwargs):
+        if isinstance(text, RequestBody) and text.document is not None:
+            schema = getattr(parser, "schema", None)
+            if schema is not None:
+                schema.assertValid(text.document)
+            return text.document
+        return etree.fromstring(text, parser, **kwargs)
+
+    @staticmethod
+    def XMLSchema(*args, file=None, **kwargs):
+        if file and not args and not kwargs:
+            return get_schema(file)
+        return etree.XMLSchema(*args, file=file, **kwargs)
+
+
+# The pycsw CSW interfaces parse and validate POST requests with the etree module they imported.
+csw2.etree = csw3.etree = RequestEtree()
+
+
+class Repository(PyCswRepository):
+    """
+    A pycsw repository which reuses the engine, reflected table, database type
+    and queryables of a prototype repository built once per worker process for
+    each database, table, filter and CSW version. Only the session and request
+    context are created for each request.
+    """
+
+    _prototypes = {}
+    _lock = threading.Lock()
+    # The full-text queries pycsw writes for csw:AnyText constraints, excluding negated ones.
+    fts_query_re = re.compile(r"(?<!not )plainto_tsquery\('(\w+)', :(pvalue\d+)\) @@ anytext_tsvector")
+    # The spatial queries pycsw writes for PostGIS (WKT geometry column) and plain PostgreSQL databases.
+    spatial_query_re = re.compile(
+        r"st_(?P<postgis_predicate>\w+)\(st_geomfromtext\((?P<postgis_column>\w+)\),\s*st_geomfromtext\('(?P<postgis_wkt>[^']+)'\)\)"
+        r"|query_spatial\((?P<column>\w+),'(?P<wkt>[^']+)','(?P<predicate>\w+)','[^']*'\)"
+    )
+    # The spatial predicates which can only be true if the bounding boxes overlap.
+    overlap_predicates = {"bbox", "intersects", "within", "contains", "equals", "overlaps", "touches", "crosses"}
+
+    def __init__(self, context, repo_filter=None):
+        config = context.server.config
+        prototype = Repository.get_prototype(config.get("repository", "database"), config.get("repository", "table"), repo_filter, context)
+        self.__dict__.update(prototype.__dict__)
+        self.context = context
+        # pycsw may rewrite the queryables mappings while handling a request.
+        self.queryables = copy.deepcopy(prototype.queryables)
+        self.session = create_session(self.engine)
+        # Use the application records dataset, if one was attached to the server.
+        dataset = getattr(context.server, "dataset", None)
+        if dataset is not None:
+            self.dataset = dataset
+        # pycsw enables full-text queries if the fts_gin_idx index exists, but an application view may not have the column.
+        self.fts = prototype.fts and "anytext_tsvector" in self.dataset.__table__.columns
+        self.extent = "bbox_minx" in self.dataset.__table__.columns
+
+    @classmethod
+    def get_prototype(cls, database, table, repo_filter, context):
+        key = (database, table, repo_filter, context.server.request_version)
+        with cls._lock:
+            if key not in cls._prototypes:
+                Repository.get_engine(database)
+                prototype = PyCswRepository(database, context, None, table, repo_filter)
+                # Only the engine, table and queryables are reused: return the connection of the prototype session to the pool.
+                prototype.session.close()
+                cls._prototypes[key] = prototype
+            return cls._prototypes[key]
+
+    @staticmethod
+    def get_engine(database):
+        """
+        Return the engine for `database`, creating it with a bounded connection pool on first use.
+        pycsw memoizes engines by URL, so its default repository shares the same pool.
+        """
+        if database not in PyCswRepository._engines:
+            PyCswRepository._engines[database] = create_engine(
+                database,
+                pool_size=settings.PYCSW_POOL_SIZE,
+                max_overflow=settings.PYCSW_POOL_MAX_OVERFLOW,
+                pool_recycle=settings.PYCSW_POOL_RECYCLE,
+                pool_pre_ping=True,
             )
+        return PyCswRepository._engines[database]
 
-            if bboxel is not None:
-                record.append(bboxel)
-        return record
+    def query(self, constraint, sortby=None, typenames=None, maxrecords=10, startposition=0):
+        """
+        Query records. If the server streams its results and the page is large enough, the
+        records are not loaded: an empty StreamedResults holding the query is returned
+        instead, for the endpoint to fetch and write the records in the response.
+        """
+        if not getattr(self.context.server, "stream_results", False) or int(maxrecords) < settings.CSW_STREAM_MIN_RECORDS:
+            return self._query(constraint, sortby, typenames, maxrecords, startposition)
+
+        session = self.session
+        self.session = create_session(self.engine, query_cls=DeferredQuery)
+        try:
+            total, results = self._query(constraint, sortby, typenames, maxrecords, startposition)
+        finally:
+            self.session.close()
+            self.session = session
+        self.context.server.streamed_results = results
+        return [total, results]
+
+    def _query(self, constraint, sortby, typenames, maxrecords, startposition):
+        """
+        Query records with the pycsw method, except that the records matching a full-text
+        query without a sort order are ordered by their full-text rank.
+        """
+        constraint = self._prefilter_spatial(constraint)
+        rank = self._get_fts_rank(constraint) if sortby is None and not util.ranking_pass else None
+        if rank is None:
+            return super(Repository, self).query(constraint, sortby, typenames, maxrecords, startposition)
+
+        query = self.session.query(self.dataset).filter(text(constraint["where"])).params(self._create_values(constraint["values"]))
+        total = self._get_repo_filter(query).count()
+        identifier = getattr(self.dataset, self.context.md_core_model["mappings"]["pycsw:Identifier"])
+        query = query.order_by(rank.desc(), identifier)
+        return [str(total), self._get_repo_filter(query).limit(maxrecords).offset(startposition).all()]
+
+    def _prefilter_spatial(self, constraint):
+        """
+        Return the constraint with each spatial query on the bounding box preceded by an
+        overlap test of the indexed extent columns, so the geometry test only runs on the
+        records whose extent overlaps the query geometry.
+        """
+        if not self.extent or "where" not in constraint:
+            return constraint
+        column = self.context.md_core_model["mappings"]["pycsw:BoundingBox"]
+
+        def prefilter(match):
+            predicate = match.group("postgis_predicate") or match.group("predicate")
+            if (match.group("postgis_column") or match.group("column")) != column or predicate not in self.overlap_predicates:
+                return match.group(0)
+            try:
+                minx, miny, maxx, maxy = (float(v) for v in util.wkt2geom(match.group("postgis_wkt") or match.group("wkt")))
+            except Exception:
+                return match.group(0)
+            return (
+                "(box(point(bbox_minx, bbox_miny), point(bbox_maxx, bbox_maxy)) && box(point({!r}, {!r}), point({!r}, {!r})) and {})"
+            ).format(minx, miny, maxx, maxy, match.group(0))
+
+        return dict(constraint, where=self.spatial_query_re.sub(prefilter, constraint["where"]))
+
+    def _get_fts_rank(self, constraint):
+        """
+        Return the ts_rank expression of the full-text queries in the constraint, or None if there aren't any.
+        """
+        if not self.fts or "where" not in constraint:
+            return None
+        values = self._create_values(constraint["values"])
+        ranks = [
+            func.ts_rank(self.dataset.__table__.c.anytext_tsvector, func.plainto_tsquery(language, values[param]))
+            for language, param in self.fts_query_re.findall(constraint["where"])
+        ]
+        return functools.reduce(operator.add, ranks) if ranks else None
+
+    def close(self):
+        """Release the request session."""
+        self.session.close()
+
+
+class DeferredQuery(Query):
+    """A query which returns the unloaded StreamedResults from all()."""
+
+    def all(self):
+        return StreamedResults(self)
+
+
+class StreamedResults(object):
+    """
+    The records of a streamed GetRecords request. pycsw sees an empty result set, and
+    the records are fetched in chunks from a server-side cursor when the response is written.
+    """
+
+    def __init__(self, query):
+        self.query = query
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+    def iter_records(self, session):
+        return self.query.with_session(session).yield_per(settings.CSW_STREAM_CHUNK_SIZE)
 
 
 @inspection._self_inspects
@@ -223,50 +535,216 @@ class Mapper(BaseMapper):
         )
 
 
-class CswEndpoint(View):
-    application_records = {}
+def csw_etag(request, app=None):
+    return get_request_version(request, app)[0]
+
 
+def csw_last_modified(request, app=None):
+    return get_request_version(request, app)[1]
+
+
+class CswEndpoint(View):
+    # The number of requests which fell back to the full records table, as the application view couldn't be reflected.
+    dataset_fallbacks = 0
+    _dataset_fallbacks_lock = threading.Lock()
+    # GetCapabilities parameters which may vary in a cached capabilities request.
+    capabilities_params = ("service", "request", "version", "acceptversions", "acceptformats", "sections")
+    # Requests whose responses are cached until the catalogue changes.
+    cached_requests = ("GetRecords", "GetRecordById")
+    # Requests which may change the catalogue.
+    transaction_requests = ("Transaction", "Harvest")
+
+    @method_decorator(condition(etag_func=csw_etag, last_modified_func=csw_last_modified))
     def get(self, request, app=None):
-        pycsw_settings = build_pycsw_settings(app)
-        server = Csw(rtconfig=pycsw_settings, env=request.META.copy())
+        kvp = self._normalize_params(request.GET)
+        capabilities_key = self._get_capabilities_key(app, kvp)
+        if capabilities_key:
+            response = capabilities_cache.get(capabilities_key, lambda: self._render_capabilities(request, app, kvp))
+            if response is not None:
+                return HttpResponse(response, content_type="application/xml")
+
+        if self._can_stream(kvp):
+            return self._stream(request, app, kvp)
+
+        if kvp.get("request") in self.cached_requests:
+            key = ("GET", app or "") + tuple(sorted(kvp.items()))
+            response = self._get_cached_response(key, lambda: self._render(request, app, kvp))[1]
+        else:
+            response = self._render(request, app, kvp)[2]
+        return HttpResponse(response, content_type="application/xml")
+
+    def _render(self, request, app, kvp, stream=False):
+        """
+        Dispatch a GET request to pycsw, returning the server, the status and the response.
+        """
+        server = build_server(app, env=request.META.copy())
+        server.stream_results = stream
         if not app:
             app = "all"
         # request by named app, use app related view
-        record_table = Application.get_view_name(app)
-        try:
-            if not self.application_records.get(app, None):
-                base = declarative_base(bind=server.repository.engine, mapper=Mapper)
-                self.application_records[app] = type(
-                    "dataset",
-                    (base,),
-                    dict(
-                        __tablename__=record_table,
-                        __table_args__={"autoload": True, "schema": None},
-                        __mapper_args__={"primary_key": ["id"]},
-                    ),
-                )
-            server.repository.dataset = self.application_records[app]
-        except BaseException:
-            pass
+        dataset = get_application_dataset(app, server.config.get("repository", "database"))
+        if dataset is None and app != "all":
+            with CswEndpoint._dataset_fallbacks_lock:
+                CswEndpoint.dataset_fallbacks += 1
+                count = CswEndpoint.dataset_fallbacks
+            LOGGER.warning("Querying the records table for the application {} ({} fallbacks)".format(app, count))
+        else:
+            # The repository is created by pycsw when the request is dispatched.
+            server.dataset = dataset
 
         server.request = "{}{}".format(get_current_site(request), reverse("csw_endpoint"))
         server.requesttype = request.method
-        server.kvp = self._normalize_params(request.GET)
-        response = server.dispatch()[1]
-        return HttpResponse(response, content_type="application/xml")
+        server.kvp = dict(kvp)
+        status_code, response = self._dispatch(server)
+        return server, status_code, response
+
+    def _can_stream(self, kvp):
+        """
+        Return True if the request is a GetRecords request for csw:Record results which can be streamed.
+        """
+        return bool(
+            settings.CSW_STREAM_MIN_RECORDS
+            and kvp.get("request") == "GetRecords"
+            and kvp.get("version") == "2.0.2"
+            and kvp.get("resulttype") == "results"
+            and kvp.get("outputschema", "http://www.opengis.net/cat/csw/2.0.2") == "http://www.opengis.net/cat/csw/2.0.2"
+            and kvp.get("outputformat", "application/xml") == "application/xml"
+            and "csw:Record" in kvp.get("typenames", "").split(",")
+            and "responsehandler" not in kvp
+            and "distributedsearch" not in kvp
+        )
+
+    def _stream(self, request, app, kvp):
+        """
+        Respond to a GetRecords request with a streamed response, if pycsw deferred loading the records.
+        """
+        server, status_code, response = self._render(request, app, kvp, stream=True)
+        results = getattr(server, "streamed_results", None)
+        if results is None or server.exception:
+            return HttpResponse(response, content_type="application/xml")
+        return StreamingHttpResponse(self._stream_records(server, results, response), content_type="application/xml")
+
+    def _stream_records(self, server, results, response):
+        """
+        Yield the response document with the records written into csw:SearchResults one at a time.
+        """
+        # Split the response document around the (empty) search results.
+        root = etree.fromstring(response)
+        searchresults = root.find("{*}SearchResults")
+        marker = uuid.uuid4().hex
+        searchresults.text = marker
+        head, tail = etree.tostring(
+            root.getroottree(), xml_declaration=True, encoding=server.encoding, standalone=False, pretty_print=server.pretty_print
+        ).split(marker.encode())
+
+        queryables = server.repository.queryables["_all"]
+        session = create_session(server.repository.engine)
+        yield head
+        try:
+            for row in results.iter_records(session):
+                yield server.write_record_bytes(row, queryables)
+        except Exception:
+            LOGGER.exception("Failed to stream the GetRecords response")
+            raise
+        finally:
+            session.close()
+        yield tail
+
+    def _get_capabilities_key(self, app, kvp):
+        """
+        Return the capabilities store key for a GetCapabilities request, or None
+        if the request isn't one which can be served from the store.
+        """
+        if kvp.get("request") != "GetCapabilities" or any(k not in self.capabilities_params for k in kvp):
+            return None
+        return (app or "",) + tuple(kvp.get(k, "") for k in self.capabilities_params)
+
+    def _render_capabilities(self, request, app, kvp):
+        """
+        Render a capabilities document for the store, or return None if pycsw
+        responded with an exception report.
+        """
+        server, status_code, response = self._render(request, app, kvp)
+        if server.exception:
+            return None
+        return response
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         return super(CswEndpoint, self).dispatch(request, *args, **kwargs)
 
     def post(self, request, app=None):
-        pycsw_settings = build_pycsw_settings()
-        server = Csw(rtconfig=pycsw_settings, env=request.META.copy(), version=self._get_post_version(request.body))
-        LOGGER.info(request.body)
+        if int(request.META.get("CONTENT_LENGTH") or 0) > settings.CSW_MAX_POST_SIZE or len(request.body) > settings.CSW_MAX_POST_SIZE:
+            return HttpResponse(
+                "The request body exceeds the maximum size of {} bytes".format(settings.CSW_MAX_POST_SIZE),
+                status=413,
+                content_type="text/plain",
+            )
+        try:
+            exml = etree.fromstring(request.body, POST_PARSER)
+        except etree.XMLSyntaxError:
+            # pycsw responds with an exception report.
+            exml = None
+
+        server = build_server(env=request.META.copy(), version=exml.get("version") if exml is not None else None)
         server.request = request.body
         server.requesttype = request.method
-        status_code, response = server.dispatch()
-        return HttpResponse(response, status=status_code, content_type="application/xml")
+        server.document = exml
+
+        request_name = etree.QName(exml).localname if exml is not None else None
+        LOGGER.info(
+            "CSW POST {} request ({} bytes): {}".format(
+                request_name, len(request.body), request.body[: settings.CSW_POST_LOG_SIZE].decode(errors="replace")
+            )
+        )
+        key = self._get_post_key(exml) if request_name in self.cached_requests else None
+        if key:
+            status_code, response = self._get_cached_response(key, lambda: (server,) + tuple(self._dispatch(server)))
+        else:
+            status_code, response = self._dispatch(server)
+            if request_name in self.transaction_requests:
+                bump_watermark_counter()
+        # pycsw returns the status line, e.g. "200 OK".
+        return HttpResponse(response, status=int(str(status_code).split()[0]), content_type="application/xml")
+
+    def _get_post_key(self, exml):
+        """
+        Return the response cache key of a POST request document, or None if it can't be canonicalized.
+        """
+        try:
+            # Canonicalize the request, so that the attribute order, quoting and empty element syntax don't change the key.
+            # The namespace prefixes are kept, as pycsw reads prefixed names in the typeNames and PropertyName values.
+            return ("POST", etree.tostring(exml, method="c14n"))
+        except etree.C14NError:
+            return None
+
+    def _get_cached_response(self, key, render):
+        """
+        Return the (status, response) for a GetRecords or GetRecordById request from the
+        response cache, calling `render()` to dispatch the request on a miss. Entries are
+        only served while the catalogue watermark is unchanged; exception reports are not cached.
+        """
+        if not response_cache.enabled:
+            return render()[1:]
+        watermark = catalogue_watermark()
+        cached = response_cache.get(key, watermark)
+        if cached is not None:
+            return cached
+        server, status_code, response = render()
+        if not server.exception:
+            response_cache.set(key, watermark, status_code, response)
+        return status_code, response
+
+    def _dispatch(self, server):
+        """
+        Dispatch the request to pycsw and return the session of the pooled
+        repository to the pool afterwards.
+        """
+        try:
+            return server.dispatch()
+        finally:
+            if isinstance(getattr(server, "repository", None), Repository):
+                server.repository.close()
 
     # TODO - Remove this method once pycsw mainlines the pending pull request
     def _normalize_params(self, query_dict):
@@ -282,7 +760,3 @@ class CswEndpoint(View):
         for k, v in query_dict.items():
             kvp[k.lower()] = v
         return kvp
-
-    def _get_post_version(self, raw_request):
-        exml = etree.fromstring(raw_request)
-        return exml.get("version")
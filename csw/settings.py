@@ -58,6 +58,26 @@ else:
 BASE_URL = env("BASE_URL", "https://csw.dbca.wa.gov.au")
 BORG_URL = env("BORG_URL", "https://borg.dbca.wa.gov.au")
 CORS_URL = env("CORS_URL", "https://sss.dbca.wa.gov.au")
+# Connection pool of the pycsw repository engine, per worker process.
+PYCSW_POOL_SIZE = env("PYCSW_POOL_SIZE", 2)
+PYCSW_POOL_MAX_OVERFLOW = env("PYCSW_POOL_MAX_OVERFLOW", 2)
+PYCSW_POOL_RECYCLE = env("PYCSW_POOL_RECYCLE", 3600)  # Seconds
+# GetRecords responses for at least this many records are streamed record by record. Set to 0 to disable streaming.
+CSW_STREAM_MIN_RECORDS = env("CSW_STREAM_MIN_RECORDS", 100)
+# Number of records fetched from the server-side cursor at a time when streaming.
+CSW_STREAM_CHUNK_SIZE = env("CSW_STREAM_CHUNK_SIZE", 50)
+# Maximum size (bytes) of a CSW POST request body.
+CSW_MAX_POST_SIZE = env("CSW_MAX_POST_SIZE", 10485760)
+# Django refuses to read request bodies larger than this, so it must admit the largest CSW POST request.
+DATA_UPLOAD_MAX_MEMORY_SIZE = max(CSW_MAX_POST_SIZE, 2621440)
+# Number of leading bytes of a CSW POST request body which are logged.
+CSW_POST_LOG_SIZE = env("CSW_POST_LOG_SIZE", 500)
+# Changes to the records of an application are batched for this many seconds before its records view is
+# refreshed. Set to 0 to refresh the view when each change is committed.
+APPLICATION_VIEW_REFRESH_DELAY = env("APPLICATION_VIEW_REFRESH_DELAY", 5)
+# The application record feeds are rebuilt with the application views. A feed older than this many seconds is
+# rebuilt when it is requested, before the signed legend urls in it expire. Set to 0 to only rebuild on changes.
+APPLICATION_FEED_MAX_AGE = env("APPLICATION_FEED_MAX_AGE", 0 if LOCAL_MEDIA_STORAGE else AZURE_URL_EXPIRATION_SECS // 2)
 
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -135,6 +155,35 @@ WHITENOISE_ROOT = STATIC_ROOT
 # Media uploads
 MEDIA_URL = "/media/"
 
+# Cache configuration
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Cached CSW responses. Each worker process has its own entries unless a shared backend (e.g. Redis) is used;
+    # an entry is only served at the catalogue watermark it was rendered at, which every worker reads from the database.
+    "csw": {
+        "BACKEND": env("CSW_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": env("CSW_CACHE_LOCATION", "csw"),
+        "TIMEOUT": env("CSW_CACHE_TIMEOUT", 3600),
+        # Least recently used entries are culled beyond this number (locmem and file backends).
+        "OPTIONS": {"MAX_ENTRIES": env("CSW_CACHE_MAX_ENTRIES", 256)},
+    },
+    # The serialized records of the records API. The entries expire before the signed legend urls in them.
+    "api": {
+        "BACKEND": env("API_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": env("API_CACHE_LOCATION", "api"),
+        "TIMEOUT": env("API_CACHE_TIMEOUT", 3600 if LOCAL_MEDIA_STORAGE else AZURE_URL_EXPIRATION_SECS // 2),
+        "OPTIONS": {"MAX_ENTRIES": env("API_CACHE_MAX_ENTRIES", 10000)},
+    },
+}
+# The cache alias used for GetRecords/GetRecordById responses. Leave blank to disable the response cache.
+CSW_RESPONSE_CACHE = env("CSW_RESPONSE_CACHE", "csw")
+# Responses larger than this (bytes) are not cached, which bounds the cache memory use.
+CSW_RESPONSE_CACHE_MAX_SIZE = env("CSW_RESPONSE_CACHE_MAX_SIZE", 262144)
+# The cache alias of the serialized records listed by the records API. Leave blank to serialize every record on each request.
+API_RECORD_CACHE = env("API_RECORD_CACHE", "api")
+
 # Logging settings - log to stdout/stderr
 LOGGING = {
     "version": 1,
@@ -165,4 +214,29 @@ LOGGING = {
 
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
+    "DEFAULT_RENDERER_CLASSES": ("catalogue.renderers.ORJSONRenderer", "rest_framework.renderers.BrowsableAPIRenderer"),
 }
+# Default and maximum number of records in a page of the records API.
+API_RECORDS_PAGE_SIZE = env("API_RECORDS_PAGE_SIZE", 100)
+API_RECORDS_MAX_PAGE_SIZE = env("API_RECORDS_MAX_PAGE_SIZE", 1000)
+# Number of style files read concurrently from the storage when the style contents are requested.
+API_STYLE_READ_WORKERS = env("API_STYLE_READ_WORKERS", 4)
+# Maximum number of records in a bulk records API request.
+API_BULK_MAX_RECORDS = env("API_BULK_MAX_RECORDS", 500)
+# Maximum number of identifiers in a records API lookup request.
+API_LOOKUP_MAX_IDENTIFIERS = env("API_LOOKUP_MAX_IDENTIFIERS", 500)
+
+# Maximum number of cached CRS transformers, and the CRSs whose transformers are created on startup.
+PROJ_TRANSFORMER_CACHE_SIZE = env("PROJ_TRANSFORMER_CACHE_SIZE", 64)
+PROJ_COMMON_CRS = env("PROJ_COMMON_CRS", "EPSG:4326,EPSG:3857,EPSG:4283,EPSG:900913").split(",")
+# The GeoWebCache gridsets of the GWC preview links, by crs: the gridset bounds, the maximum zoom level and the tile size.
+GWC_GRIDSETS = env(
+    "GWC_GRIDSETS",
+    {
+        "EPSG:4326": {"bounds": [0, -90, 180, 90], "max_zoom": 14, "tile_size": 1024},
+        "EPSG:3857": {"bounds": [-20037508.34, -20037508.34, 20037508.34, 20037508.34], "max_zoom": 14, "tile_size": 1024},
+        "EPSG:900913": {"bounds": [-20037508.34, -20037508.34, 20037508.34, 20037508.34], "max_zoom": 14, "tile_size": 1024},
+    },
+)
+# The CRSs whose record extents and preview tiles are precomputed on save, for the ows links.
+RECORD_EXTENT_CRS = env("RECORD_EXTENT_CRS", ",".join(GWC_GRIDSETS)).split(",")
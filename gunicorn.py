@@ -10,3 +10,16 @@ max_requests_jitter = 256
 preload_app = True
 # Disable access logging.
 accesslog = None
+
+
+def post_fork(server, worker):
+    # Reflect the application record views before the worker handles any request.
+    from django.db import connections
+
+    from catalogue.matviews import view_refresher
+    from catalogue.views import warm_up
+
+    warm_up()
+    # Refresh the application views whose refresh was lost when a previous worker process exited.
+    view_refresher.schedule()
+    connections.close_all()